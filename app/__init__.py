@@ -3,25 +3,55 @@ from .models import db
 from .routes import bp
 import os
 
-def create_app():
+def create_app(config_name=None):
+    from config import CONFIGS
+
     app = Flask(__name__, instance_relative_config=True)
 
+    config_name = config_name or os.environ.get("POWERSCALE_ENV", "development")
+    app.config.from_object(CONFIGS[config_name])
+
     # Ensure instance folder exists
     try:
         os.makedirs(app.instance_path, exist_ok=True)
     except OSError:
         pass
 
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(app.instance_path, "powerscale.db")
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if not app.config["SQLALCHEMY_DATABASE_URI"]:
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(app.instance_path, "powerscale.db")
 
     db.init_app(app)
 
+    from .utils.cache import init_cache
+    init_cache(app)
+
     with app.app_context():
+        from .utils.sqlite import install_pragmas, install_transaction_control
+        install_pragmas(db.engine, app.config["SQLITE_PRAGMAS"])
+        install_transaction_control(db.engine)
+
+        from .utils.instrumentation import init_instrumentation
+        init_instrumentation(app, db.engine)
+
         db.create_all()
 
+        from .utils.migrations import upgrade_schema
+        upgrade_schema()
+
+        from .utils.jobs import init_jobs
+        init_jobs(app)
+
+        from .utils.snapshot import init_snapshot
+        init_snapshot(app)
+
     from .routes import bp
     app.register_blueprint(bp)
 
-    return app
+    from .api import api
+    app.register_blueprint(api)
 
+    from .commands import data_cli, jobs_cli
+    app.cli.add_command(data_cli)
+    app.cli.add_command(jobs_cli)
+
+    return app
@@ -0,0 +1,193 @@
+from flask import Blueprint, request
+from .models import db, Verse, Character, Key, Hax
+from app.utils.cache import cached, conditional
+from app.utils.changes import changes_since
+from app.utils.ranking import rank_positions, show_one_key
+
+# Read-only JSON API. Every response carries a strong ETag built from the
+# cache scope versions of the data it reads (see utils/cache.py), so polling
+# clients that send If-None-Match get a 304 without a database query.
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+KEY_LOADING = (
+    db.joinedload(Key.character),
+    db.selectinload(Key.hax),
+)
+
+BATCH_MAX = 100
+CHANGES_BATCH_MAX = 1000
+
+def _key(key):
+    return {
+        "id": key.id,
+        "character_id": key.character_id,
+        "character": key.character.name,
+        "verse_id": key.verse_id,
+        "key_name": key.key_name,
+        "ap": key.ap,
+        "tier": key.tier,
+        "durability": key.durability,
+        "speed": key.speed,
+        "notes": key.notes,
+        "hax": [_hax(h) for h in key.hax]
+    }
+
+def _verse(verse):
+    return {"id": verse.id, "name": verse.name}
+
+def _character(character):
+    return {"id": character.id, "name": character.name, "verse_id": character.verse_id}
+
+def _hax(hax):
+    return {"id": hax.id, "name": hax.name}
+
+# entity: (key in the response, model, loader options, serializer)
+CHANGE_PAYLOADS = {
+    "verse": ("verses", Verse, (), _verse),
+    "character": ("characters", Character, (), _character),
+    "key": ("keys", Key, KEY_LOADING, _key),
+    "hax": ("hax", Hax, (), _hax),
+}
+
+@api.errorhandler(404)
+def not_found(_):
+    return {"error": "Not found."}, 404
+
+# Verses
+
+@api.route("/verses")
+@conditional(lambda: ("verses",))
+@cached(lambda: ("verses",))
+def verses():
+    return {
+        "verses": [
+            _verse(v) for v in Verse.query.order_by(Verse.name)
+        ]
+    }
+
+@api.route("/verses/<int:verse_id>")
+@conditional(lambda verse_id: (f"verse:{verse_id}",))
+@cached(lambda verse_id: (f"verse:{verse_id}",))
+def verse(verse_id):
+    verse = Verse.query.get_or_404(verse_id)
+    characters = (
+        Character.query
+        .filter(Character.verse_id == verse_id)
+        .order_by(Character.name, Character.id)
+    )
+
+    return {
+        "id": verse.id,
+        "name": verse.name,
+        "characters": [{"id": c.id, "name": c.name} for c in characters]
+    }
+
+# Ranked keys of a verse, best first; single=1 keeps each character's best key
+
+@api.route("/verses/<int:verse_id>/rankings")
+@conditional(lambda verse_id: (f"verse:{verse_id}", "hax"))
+@cached(lambda verse_id: (f"verse:{verse_id}", "hax"))
+def rankings(verse_id):
+    Verse.query.get_or_404(verse_id)
+
+    if request.args.get("single") == "1":
+        keys = show_one_key(verse_id)
+    else:
+        keys = (
+            Key.query
+            .options(*KEY_LOADING)
+            .filter(Key.verse_id == verse_id, Key.rank.isnot(None))
+            .order_by(Key.rank.asc(), Key.id.asc())
+            .all()
+        )
+
+    positions = rank_positions(verse_id)
+    return {
+        "verse_id": verse_id,
+        "rankings": [{"position": positions[k.id], **_key(k)} for k in keys]
+    }
+
+# Characters
+
+@api.route("/characters/<int:char_id>")
+@conditional(lambda char_id: ("global",))
+@cached(lambda char_id: ("global",))
+def character(char_id):
+    character = Character.query.get_or_404(char_id)
+    keys = (
+        Key.query
+        .options(*KEY_LOADING)
+        .filter(Key.character_id == char_id)
+        .order_by(Key.id)
+    )
+
+    return {
+        "id": character.id,
+        "name": character.name,
+        "verse_id": character.verse_id,
+        "keys": [_key(k) for k in keys]
+    }
+
+# Keys, one by id or a batch with ?ids=1,2,3
+
+@api.route("/keys/<int:key_id>")
+@conditional(lambda key_id: ("global",))
+@cached(lambda key_id: ("global",))
+def key(key_id):
+    key = Key.query.options(*KEY_LOADING).filter(Key.id == key_id).first_or_404()
+    return _key(key)
+
+@api.route("/keys")
+@conditional(lambda: ("global",))
+@cached(lambda: ("global",))
+def keys():
+    try:
+        ids = [int(i) for i in request.args.get("ids", "").split(",") if i.strip()]
+    except ValueError:
+        return {"error": "ids must be a comma-separated list of key ids."}, 400
+
+    if not ids or len(ids) > BATCH_MAX:
+        return {"error": f"Give between 1 and {BATCH_MAX} key ids."}, 400
+
+    found = {
+        k.id: k
+        for k in Key.query.options(*KEY_LOADING).filter(Key.id.in_(ids))
+    }
+
+    return {
+        "keys": [_key(found[i]) for i in dict.fromkeys(ids) if i in found],
+        "missing": [i for i in dict.fromkeys(ids) if i not in found]
+    }
+
+# Change feed. A client applies the upserts and deletes of each batch and
+# asks again with since=<next> while more is true; since=0 is a full sync
+# from an empty state. Each changed entity appears once per batch, in its
+# current state.
+
+@api.route("/changes")
+@conditional(lambda: ("global",))
+@cached(lambda: ("global",))
+def changes():
+    try:
+        since = int(request.args.get("since", 0))
+        limit = int(request.args.get("limit", CHANGES_BATCH_MAX))
+    except ValueError:
+        return {"error": "since and limit must be integers."}, 400
+    limit = min(max(limit, 1), CHANGES_BATCH_MAX)
+
+    ops, last, more = changes_since(db.session, since, limit)
+    body = {"since": since, "next": last, "more": more}
+
+    for entity, (name, model, loading, serialize) in CHANGE_PAYLOADS.items():
+        upserted = [i for i, op in ops[entity].items() if op == "upsert"]
+        rows = model.query.options(*loading).filter(model.id.in_(upserted)).all() if upserted else []
+        found = {row.id for row in rows}
+
+        # rows changed and then deleted after this batch are reported as deleted
+        body[name] = {
+            "upserts": [serialize(row) for row in sorted(rows, key=lambda row: row.id)],
+            "deletes": sorted(i for i in ops[entity] if i not in found),
+        }
+
+    return body
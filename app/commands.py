@@ -0,0 +1,97 @@
+import click
+from flask.cli import AppGroup
+from app.models import db, Job
+from app.utils.bulk import (
+    CHUNK_SIZE, FORMATS, export_records, format_for, import_stream, write_export
+)
+from app.utils.jobs import TASKS, cancel_job, create_job, run_job
+from app.utils.ranking import resequence_all, resequence_ranks
+from app.utils.transactions import begin_write
+
+data_cli = AppGroup("data", help="Bulk import and export of verses, characters, keys and hax.")
+
+@data_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension.")
+@click.option("--chunk-size", default=CHUNK_SIZE, show_default=True, help="Rows per transaction.")
+def import_command(path, fmt, chunk_size):
+    """Import a CSV or JSONL file."""
+    def progress(report):
+        click.echo(f"  {report.rows} rows, {report.keys} keys ({report.rows_per_second:.0f} rows/s)", err=True)
+
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        report = import_stream(stream, fmt or format_for(path), chunk_size, progress)
+
+    for error in report.errors:
+        click.echo(error, err=True)
+    click.echo(report.summary())
+
+@data_cli.command("export")
+@click.argument("path", default="-", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension, or csv.")
+def export_command(path, fmt):
+    """Export every key to a CSV or JSONL file (default: stdout)."""
+    fmt = fmt or format_for(path)
+    blocks = write_export(export_records(), fmt)
+
+    if path == "-":
+        out = click.get_text_stream("stdout")
+        for block in blocks:
+            out.write(block)
+        return
+
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        for block in blocks:
+            out.write(block)
+
+@data_cli.command("resequence")
+@click.option("--verse", "verse_id", type=int, help="Only this verse; default is every verse.")
+def resequence_command(verse_id):
+    """Respread ranks evenly, keeping their order."""
+    begin_write()
+    if verse_id is None:
+        resequence_all()
+    else:
+        resequence_ranks(verse_id)
+    db.session.commit()
+
+jobs_cli = AppGroup("jobs", help="Run and manage background maintenance jobs.")
+
+@jobs_cli.command("run")
+@click.argument("kind", type=click.Choice(list(TASKS)))
+@click.argument("params", nargs=-1)
+def run_command(kind, params):
+    """Run a job in the foreground, e.g. `run resequence verse_id=3`.
+
+    Jobs: resequence [verse_id], rebuild [target=search|leaderboard|cooccurrence],
+    import path= fmt= [chunk_size], delete_verse verse_id.
+    """
+    try:
+        values = dict(param.split("=", 1) for param in params)
+        job = create_job(kind, **values)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+
+    def progress(job):
+        total = f"/{job.total}" if job.total else ""
+        click.echo(f"  {job.done}{total} {job.message or ''}", err=True)
+
+    job = run_job(job.id, progress)
+    outcome = job.result if job.status == "succeeded" else job.message
+    click.echo(f"job {job.id} {job.status}: {outcome}")
+    if job.status != "succeeded":
+        raise SystemExit(1)
+
+@jobs_cli.command("list")
+@click.option("--limit", default=20, show_default=True)
+def list_command(limit):
+    """Show the most recent jobs."""
+    for job in Job.query.order_by(Job.id.desc()).limit(limit):
+        progress = f"{job.done}/{job.total}" if job.total else str(job.done)
+        click.echo(f"{job.id:>5} {job.kind:<14} {job.status:<10} {progress:>12}  {job.message or ''}")
+
+@jobs_cli.command("cancel")
+@click.argument("job_id", type=int)
+def cancel_command(job_id):
+    """Cancel a queued or running job."""
+    cancel_job(job_id)
@@ -1,7 +1,21 @@
+import os
+from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, true
+from sqlalchemy.orm import validates
+from .powerstats import stat_fields
 
 db = SQLAlchemy()
 
+# Views declare the relationships they need with selectinload/joinedload.
+# Setting POWERSCALE_STRICT_LOADING=1 (e.g. when running tests) makes any
+# lazy load that would hit the database raise instead of quietly adding queries.
+LAZY = "raise_on_sql" if os.environ.get("POWERSCALE_STRICT_LOADING") == "1" else "select"
+
+def normalize_name(value):
+    # lookup form of a name for prefix search: case-folded, single-spaced
+    return " ".join((value or "").split()).casefold()
+
 
 class Verse(db.Model):
     __tablename__ = "verses"
@@ -9,7 +23,14 @@ class Verse(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), unique=True, nullable=False)
 
-    characters = db.relationship("Character", backref="verse_obj", cascade="all, delete")
+    # characters, keys and hax links go with the verse through ON DELETE CASCADE
+    characters = db.relationship(
+        "Character",
+        backref=db.backref("verse_obj", lazy=LAZY),
+        cascade="all, delete",
+        passive_deletes=True,
+        lazy=LAZY
+    )
 
 
 class Character(db.Model):
@@ -17,15 +38,29 @@ class Character(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
+    name_norm = db.Column(db.String(200), index=True)
 
-    verse_id = db.Column(db.Integer, db.ForeignKey("verses.id"), nullable=False)
+    verse_id = db.Column(db.Integer, db.ForeignKey("verses.id", ondelete="CASCADE"), nullable=False, index=True)
 
-    keys = db.relationship("Key", backref="character", cascade="all, delete")
+    keys = db.relationship(
+        "Key",
+        backref=db.backref("character", lazy=LAZY),
+        cascade="all, delete",
+        passive_deletes=True,
+        lazy=LAZY
+    )
+
+    @validates("name")
+    def _sync_name_norm(self, _, value):
+        self.name_norm = normalize_name(value)
+        return value
 
 key_hax_table = db.Table(
     "key_hax",
-    db.Column("key_id", db.Integer, db.ForeignKey("keys.id"), primary_key=True),
-    db.Column("hax_id", db.Integer, db.ForeignKey("hax.id"), primary_key=True)
+    db.Column("key_id", db.Integer, db.ForeignKey("keys.id", ondelete="CASCADE"), primary_key=True),
+    db.Column("hax_id", db.Integer, db.ForeignKey("hax.id", ondelete="CASCADE"), primary_key=True),
+    # per-hax lookups (usage counts, keys with a hax); the primary key covers per-key ones
+    db.Index("ix_key_hax_hax", "hax_id", "key_id")
 )
 
 class Hax(db.Model):
@@ -38,9 +73,14 @@ class Key(db.Model):
     __tablename__ = "keys"
 
     id = db.Column(db.Integer, primary_key=True)
-    character_id = db.Column(db.Integer, db.ForeignKey("characters.id"), nullable=False)
+    character_id = db.Column(db.Integer, db.ForeignKey("characters.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # Copy of character.verse_id so per-verse rank queries don't need a join;
+    # moving a character updates its keys in edit_character
+    verse_id = db.Column(db.Integer, db.ForeignKey("verses.id", ondelete="CASCADE"), nullable=False)
 
     key_name = db.Column(db.String(200), nullable=False)
+    key_name_norm = db.Column(db.String(200), index=True)
 
     ap = db.Column(db.String(200))
     tier = db.Column(db.String(200))
@@ -48,10 +88,163 @@ class Key(db.Model):
     speed = db.Column(db.String(200))
     rank = db.Column(db.Integer, nullable=True)
 
+    # Scale positions from powerstats, kept in sync with the strings above
+    ap_ord = db.Column(db.Integer)
+    tier_ord = db.Column(db.Integer)
+    durability_ord = db.Column(db.Integer)
+    speed_ord = db.Column(db.Integer)
+
+    # [low, high] scale positions parsed from free-form values such as
+    # "At least Planet" or "Low 2-C to 2-B", for range overlap queries
+    ap_low = db.Column(db.Integer)
+    ap_high = db.Column(db.Integer)
+    tier_low = db.Column(db.Integer)
+    tier_high = db.Column(db.Integer)
+    durability_low = db.Column(db.Integer)
+    durability_high = db.Column(db.Integer)
+    speed_low = db.Column(db.Integer)
+    speed_high = db.Column(db.Integer)
+
     notes = db.Column(db.String(2000))
 
-    hax = db.relationship("Hax", secondary=key_hax_table, backref="keys")
+    hax = db.relationship(
+        "Hax",
+        secondary=key_hax_table,
+        backref=db.backref("keys", lazy=LAZY, passive_deletes=True),
+        passive_deletes=True,
+        lazy=LAZY
+    )
 
     __table_args__ = (
-        db.Index("ix_key_verse_rank", "rank"),
+        # sparse ranks are unique within a verse; NULL (unranked) may repeat
+        db.Index("ux_key_verse_rank", "verse_id", "rank", unique=True),
+        db.Index("ix_key_verse_tier", "verse_id", "tier_ord"),
+        db.Index("ix_key_tier_ord", "tier_ord", "ap_ord"),
+        db.Index("ix_key_ap_ord", "ap_ord", "durability_ord"),
+        db.Index("ix_key_durability_ord", "durability_ord"),
+        db.Index("ix_key_speed_ord", "speed_ord"),
+        db.Index("ix_key_ap_range", "ap_low", "ap_high"),
+        db.Index("ix_key_tier_range", "tier_low", "tier_high"),
+        db.Index("ix_key_durability_range", "durability_low", "durability_high"),
+        db.Index("ix_key_speed_range", "speed_low", "speed_high"),
+        # leading term of the /keys?sort= keyset order (utils/filters.py)
+        db.Index("ix_key_tier_sort", func.coalesce(tier_ord, -1)),
+        db.Index("ix_key_ap_sort", func.coalesce(ap_ord, -1)),
+        db.Index("ix_key_durability_sort", func.coalesce(durability_ord, -1)),
+        db.Index("ix_key_speed_sort", func.coalesce(speed_ord, -1)),
     )
+
+    @validates("key_name")
+    def _sync_key_name_norm(self, _, value):
+        self.key_name_norm = normalize_name(value)
+        return value
+
+    @validates("ap", "tier", "durability", "speed")
+    def _sync_ordinal(self, stat, value):
+        for column, derived in stat_fields(stat, value).items():
+            setattr(self, column, derived)
+        return value
+
+class LeaderboardEntry(db.Model):
+    # Global leaderboard: one row per key, projected from keys by
+    # utils/leaderboard.py and refreshed by the key write paths.
+    # order_key packs the stat ordinals so that ascending order is strongest
+    # first; with verse_rank and key_id the whole ordering is one ascending index.
+    __tablename__ = "leaderboard"
+
+    NO_RANK = 2 ** 62
+
+    key_id = db.Column(db.Integer, db.ForeignKey("keys.id", ondelete="CASCADE"), primary_key=True)
+    character_id = db.Column(db.Integer, db.ForeignKey("characters.id", ondelete="CASCADE"), nullable=False, index=True)
+    verse_id = db.Column(db.Integer, db.ForeignKey("verses.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    order_key = db.Column(db.BigInteger, nullable=False)
+    # the key's displayed rank in its verse, NO_RANK when unranked
+    verse_rank = db.Column(db.BigInteger, nullable=False)
+
+    # strongest key of its character
+    is_best = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        db.Index("ix_leaderboard_order", order_key, verse_rank, key_id),
+        db.Index(
+            "ix_leaderboard_best", order_key, verse_rank, key_id,
+            sqlite_where=is_best.is_(true())
+        ),
+    )
+
+class HaxCooccurrence(db.Model):
+    # Number of keys that have both hax_id and other_id, stored in both
+    # directions. Maintained by triggers on key_hax (utils/hax.py).
+    __tablename__ = "hax_cooccurrence"
+
+    hax_id = db.Column(db.Integer, db.ForeignKey("hax.id", ondelete="CASCADE"), primary_key=True)
+    other_id = db.Column(db.Integer, db.ForeignKey("hax.id", ondelete="CASCADE"), primary_key=True, index=True)
+    keys = db.Column(db.Integer, nullable=False)
+
+class VerseRanking(db.Model):
+    # Optimistic lock for a verse's ranks. Every rank write bumps the row
+    # (utils/ranking.py), and the UPDATE only matches the version this
+    # transaction read, so of two writers working from the same ranks the
+    # second fails with StaleDataError and is retried.
+    __tablename__ = "verse_rankings"
+
+    verse_id = db.Column(db.Integer, db.ForeignKey("verses.id", ondelete="CASCADE"), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    __mapper_args__ = {"version_id_col": version}
+
+class Change(db.Model):
+    # Append-only change log written by triggers (utils/changes.py): one row
+    # per insert, update or delete of a verse, character, key or hax; key_hax
+    # links log an upsert of their key. AUTOINCREMENT keeps seq increasing
+    # and records the last one handed out in sqlite_sequence.
+    __tablename__ = "changes"
+
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(8), nullable=False)  # "upsert" or "delete"
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index("ix_change_entity", "entity", "entity_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+class Job(db.Model):
+    # Background maintenance job (utils/jobs.py). params and result are JSON;
+    # done/total is progress in whatever unit the job reports. pid is the
+    # process that runs the job, used to spot jobs orphaned by a restart.
+    __tablename__ = "jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+
+    done = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    message = db.Column(db.String(2000))
+    result = db.Column(db.JSON)
+
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    pid = db.Column(db.Integer)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def finished(self):
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    @property
+    def percent(self):
+        if not self.total:
+            return None
+        return min(100, round(100 * self.done / self.total))
+
+# Resolve backrefs now so views can reference them in loader options at import time
+db.configure_mappers()
@@ -1,5 +1,8 @@
 # app/powerstats.py
 
+import re
+from functools import lru_cache
+
 AP_OPTIONS = [
     "Below Average Human", "Human", "Athlete",
     "Street", "Wall", "Small Building", "Building",
@@ -66,4 +69,178 @@ DURABILITY_OPTIONS = AP_OPTIONS[:]  # identical scale
 AP_TO_TIER = dict(zip(AP_OPTIONS, TIER_OPTIONS))
 
 def tier_from_ap(ap_value):
-    return AP_TO_TIER.get(ap_value, "Unknown")
+    # the AP and tier scales line up step for step, so an AP interval maps
+    # onto a tier interval
+    interval = stat_interval("ap", ap_value)
+    if interval is None:
+        return "Unknown"
+
+    low, high = interval
+    if low == high:
+        return TIER_OPTIONS[low]
+    if high == len(TIER_OPTIONS) - 1:
+        return f"At least {TIER_OPTIONS[low]}"
+    if low == 0:
+        return f"At most {TIER_OPTIONS[high]}"
+    return f"{TIER_OPTIONS[low]} to {TIER_OPTIONS[high]}"
+
+# Ordinal positions on each scale, stored alongside the display strings so
+# stat comparisons, range filters and sorts can run inside the database.
+AP_ORDINALS = {value: i for i, value in enumerate(AP_OPTIONS)}
+TIER_ORDINALS = {value: i for i, value in enumerate(TIER_OPTIONS)}
+SPEED_ORDINALS = {value: i for i, value in enumerate(SPEED_OPTIONS)}
+DURABILITY_ORDINALS = AP_ORDINALS
+
+STAT_ORDINALS = {
+    "ap": AP_ORDINALS,
+    "tier": TIER_ORDINALS,
+    "durability": DURABILITY_ORDINALS,
+    "speed": SPEED_ORDINALS,
+}
+
+def stat_ordinal(stat, value):
+    return STAT_ORDINALS[stat].get(value)
+
+# Stat grammar. Entries are often not a single scale value:
+#
+#   "At least Planet", "Low 2-C to 2-B", "Multi-City Block+ (likely Town)"
+#
+# A value is a list of alternatives (separated by commas, "or", "|", or in
+# parentheses), each a range ("A to B", "A - B", "A-B") or a point with
+# optional qualifiers ("likely", ...) and suffixes ("+", "level"). "At least
+# X" reaches up to the top of the scale and "at most X" / "up to X" down to
+# the bottom. Points not on the scale fall back to their base value, so
+# "High Star" reads as Star. The result is the [low, high] interval of scale
+# positions covering every alternative, or None if nothing in the value is
+# on the scale.
+
+STAT_SCALES = {
+    "ap": AP_OPTIONS,
+    "tier": TIER_OPTIONS,
+    "durability": DURABILITY_OPTIONS,
+    "speed": SPEED_OPTIONS,
+}
+
+_ALIASES = {
+    "continent": "Contintent",
+    "mhs": "Massively Hypersonic",
+    "massively hypersonic+": "MHS+",
+    "mftl": "Massively FTL",
+    "mftl+": "Massively FTL+",
+}
+
+_LOOKUPS = {
+    stat: {
+        **{alias: options.index(value) for alias, value in _ALIASES.items() if value in options},
+        **{value.casefold(): i for i, value in enumerate(options)},
+    }
+    for stat, options in STAT_SCALES.items()
+}
+
+_PARENTHESES = re.compile(r"\(([^()]*)\)")
+_ALTERNATIVES = re.compile(r"\s*(?:[,;/|]|\bor\b|\band\b)\s*", re.IGNORECASE)
+_RANGE = re.compile(r"(?<!\bup)\s+(?:to|-)\s+|\s*[\u2013\u2014]\s*", re.IGNORECASE)
+_UP_TO = re.compile(r"\s+up\s+to\s+", re.IGNORECASE)
+_QUALIFIERS = re.compile(
+    r"^(?:(?:at\s+least|at\s+most|up\s+to|likely|possibly|probably|potentially|"
+    r"presumably|around|about|roughly|higher|lower|varies|even)\s+)+",
+    re.IGNORECASE
+)
+_AT_LEAST = re.compile(r"\bat\s+least\b", re.IGNORECASE)
+_AT_MOST = re.compile(r"\b(?:at\s+most|up\s+to)\b", re.IGNORECASE)
+_LEVEL = re.compile(r"\s+(?:level|tier)$", re.IGNORECASE)
+_GRADE = re.compile(r"^(?:high|low|mid)\s+", re.IGNORECASE)
+
+def _position(lookup, text):
+    text = _LEVEL.sub("", text.strip()).casefold()
+
+    for candidate in (text, text.rstrip("+ "), _GRADE.sub("", text.rstrip("+ "))):
+        position = lookup.get(candidate)
+        if position is not None:
+            return position
+    return None
+
+def _point(lookup, text):
+    # a scale value, or two joined by a bare hyphen ("Mountain-Island");
+    # scale values have hyphens of their own ("Multi-City Block", "Low 2-C"),
+    # so every split is tried
+    position = _position(lookup, text)
+    if position is not None:
+        return position, position
+
+    pieces = text.split("-")
+    for i in range(1, len(pieces)):
+        low = _position(lookup, "-".join(pieces[:i]))
+        high = _position(lookup, "-".join(pieces[i:]))
+        if low is not None and high is not None:
+            return min(low, high), max(low, high)
+    return None
+
+def _bounds(part):
+    # "A to B" -> [A, B]; "up to" is a qualifier unless a value comes
+    # before it ("Town up to City")
+    bounds = []
+    for bound in _RANGE.split(part.strip()):
+        up_to = _UP_TO.search(bound)
+        qualifiers = _QUALIFIERS.match(bound)
+        if up_to and not (qualifiers and qualifiers.end() >= up_to.end()):
+            bounds += [bound[:up_to.start()], bound[up_to.end():]]
+        else:
+            bounds.append(bound)
+    return bounds
+
+def _bound(lookup, top, text):
+    text = text.strip()
+    qualifiers = _QUALIFIERS.match(text)
+    qualifiers = qualifiers.group(0) if qualifiers else ""
+
+    interval = _point(lookup, text[len(qualifiers):])
+    if interval is None:
+        return None
+
+    low, high = interval
+    if _AT_LEAST.search(qualifiers):
+        high = top
+    elif _AT_MOST.search(qualifiers):
+        low = 0
+    return low, high
+
+@lru_cache(maxsize=4096)
+def stat_interval(stat, value):
+    if not value:
+        return None
+
+    lookup = _LOOKUPS[stat]
+    top = len(STAT_SCALES[stat]) - 1
+    text = " ".join(value.split())
+
+    exact = lookup.get(text.casefold())
+    if exact is not None:
+        return exact, exact
+
+    alternatives = [_PARENTHESES.sub(" ", text), *_PARENTHESES.findall(text)]
+    intervals = [
+        interval
+        for alternative in alternatives
+        for part in _ALTERNATIVES.split(alternative)
+        for bound in _bounds(part)
+        if (interval := _bound(lookup, top, bound)) is not None
+    ]
+
+    if not intervals:
+        return None
+    return min(low for low, _ in intervals), max(high for _, high in intervals)
+
+def stat_fields(stat, value):
+    # the stored columns derived from one stat string. A value that isn't a
+    # single scale step, such as "Low 2-C to 2-B" or "At least Planet",
+    # sorts and filters by its low end instead of as unknown.
+    interval = stat_interval(stat, value) or (None, None)
+    ordinal = stat_ordinal(stat, value)
+    if ordinal is None:
+        ordinal = interval[0]
+    return {
+        f"{stat}_ord": ordinal,
+        f"{stat}_low": interval[0],
+        f"{stat}_high": interval[1],
+    }
@@ -1,19 +1,59 @@
-from flask import Blueprint, render_template, request, redirect, url_for
-from .models import db, Verse, Character, Key, Hax
+import json
+import os
+import uuid
+from flask import (
+    Blueprint, Response, abort, current_app, render_template, request, redirect, url_for,
+    stream_with_context
+)
+from .models import (
+    db, Verse, Character, Key, Hax, Job, LeaderboardEntry, key_hax_table, normalize_name
+)
 from .powerstats import (
     AP_OPTIONS, TIER_OPTIONS, SPEED_OPTIONS,
     DURABILITY_OPTIONS, AP_TO_TIER, tier_from_ap
 )
-from sqlalchemy import func
-from app.utils.ranking import assign_rank, resequence_ranks, show_one_key
+from sqlalchemy import select, true, union
+from app.utils.ranking import (
+    assign_rank, move_character_keys, resequence_ranks, show_one_key, rank_positions, rank_position
+)
+from app.utils.filters import apply_stat_filters, stat_sort, stat_sort_key
+from app.utils.pagination import encode_cursor, decode_cursor, keyset_page
+from app.utils.hax import resolve_hax, hax_names, hax_usage, cooccurring_hax
+from app.utils.search import search as run_search
+from app.utils.matchup import load_side, matchup_matrix, summarize
+from app.utils.leaderboard import LEADERBOARD_ORDER, refresh_characters, refresh_verse_ranks
+from app.utils.cache import cached
+from app.utils.transactions import write_transaction
+from app.utils.instrumentation import render_metrics
+from app.utils.bulk import FORMATS, export_records, format_for, write_export
+from app.utils.jobs import REBUILDS, cancel_job, enqueue
+from app.utils.snapshot import STATS, key_columns, stat_distribution, stat_percentiles, verse_overview
+from app.utils.similar import similar_keys
 from sqlalchemy.exc import IntegrityError
 
 
 bp = Blueprint("main", __name__)
 
+# Loading policies: every relationship a template walks is loaded up front.
+# Run with POWERSCALE_STRICT_LOADING=1 to make anything missed here raise.
+CHARACTER_ROW_LOADING = (db.joinedload(Character.verse_obj),)
+CHARACTER_PAGE_LOADING = (
+    db.joinedload(Character.verse_obj),
+    db.selectinload(Character.keys).selectinload(Key.hax),
+)
+KEY_PAGE_LOADING = (
+    db.joinedload(Key.character).joinedload(Character.verse_obj),
+    db.selectinload(Key.hax),
+)
+
 @bp.route("/")
 def index():
-    characters = Character.query.order_by(Character.name).all()
+    characters = (
+        Character.query
+        .options(*CHARACTER_ROW_LOADING)
+        .order_by(Character.name)
+        .all()
+    )
     return render_template("character_list.html", characters=characters)
 
 # Add Verse
@@ -40,6 +80,7 @@ def add_verse():
 # Add Character
 
 @bp.route("/add", methods=["GET", "POST"])
+@write_transaction
 def add_character():
     verses = Verse.query.order_by(Verse.name).all()
 
@@ -58,7 +99,7 @@ def add_character():
             else:
                 new_verse = Verse(name=new_verse_name)
                 db.session.add(new_verse)
-                db.session.commit()
+                db.session.flush()
                 verse_id = new_verse.id
 
         if not verse_id:
@@ -67,7 +108,7 @@ def add_character():
 
         new_char = Character(name=name, verse_id=int(verse_id))
         db.session.add(new_char)
-        db.session.commit()
+        db.session.flush()
 
         key_name = request.form.get("key_name", "").strip()
         ap = request.form.get("ap", "").strip()
@@ -78,41 +119,33 @@ def add_character():
             durability = request.form.get("durability", ap)
             notes = request.form.get("notes", "")
 
-            raw_hax = request.form.getlist("hax_list")
-            hax_objects = []
+            hax_objects = resolve_hax(request.form.getlist("hax_list"))
 
-            for h in raw_hax:
-                if h.isdigit():
-                    obj = Hax.query.get(int(h))
-                else:
-                    obj = Hax.query.filter_by(name=h).first()
-                    if not obj:
-                        obj = Hax(name=h)
-                        db.session.add(obj)
-                hax_objects.append(obj)
+            rank = request.form.get("rank")
 
-        rank = request.form.get("rank")
+            new_key = Key(
+                character_id=new_char.id,
+                verse_id=new_char.verse_id,
+                key_name=key_name,
+                ap=ap,
+                tier=tier,
+                speed=speed,
+                durability=durability,
+                notes=notes,
+                hax=hax_objects
+            )
 
-        new_key = Key(
-            character_id=new_char.id,
-            key_name=key_name,
-            ap=ap,
-            tier=tier,
-            speed=speed,
-            durability=durability,
-            notes=notes,
-            hax=hax_objects
-        )
+            db.session.add(new_key)
+            db.session.flush()  # REQUIRED so new_key.id exists
 
-        db.session.add(new_key)
-        db.session.flush()  # REQUIRED so new_key.id exists
+            if rank:
+                assign_rank(new_key, new_char.verse_id, int(rank))
 
-        if rank:
-            assign_rank(new_key, new_char.verse_id, int(rank))
+            refresh_characters([new_char.id])
 
+        # verse, character and key are saved together
         db.session.commit()
 
-
         return redirect(url_for("main.character_detail", char_id=new_char.id))
 
     all_hax = Hax.query.order_by(Hax.name).all()
@@ -131,15 +164,17 @@ def add_character():
 # Character Detail Table
 
 @bp.route("/character/<int:char_id>")
+@cached(lambda char_id: ("global",))
 def character_detail(char_id):
-    character = Character.query.get_or_404(char_id)
+    character = Character.query.options(*CHARACTER_PAGE_LOADING).get_or_404(char_id)
     return render_template("character_detail.html", character=character)
 
 # Add Key
 
 @bp.route("/character/<int:char_id>/add_key", methods=["GET","POST"])
+@write_transaction
 def add_key(char_id):
-    character = Character.query.get_or_404(char_id)
+    character = Character.query.options(*CHARACTER_PAGE_LOADING).get_or_404(char_id)
 
     if request.method == "POST":
         key_name = request.form.get("key_name", "").strip()
@@ -153,23 +188,13 @@ def add_key(char_id):
 
         tier = tier_from_ap(ap)
 
-        raw_hax = request.form.getlist("hax_list")
-        hax_objects = []
-
-        for h in raw_hax:
-            if h.isdigit():
-                obj = Hax.query.get(int(h))
-            else:
-                obj = Hax.query.filter_by(name=h).first()
-                if not obj:
-                    obj = Hax(name=h)
-                    db.session.add(obj)
-            hax_objects.append(obj)
+        hax_objects = resolve_hax(request.form.getlist("hax_list"))
 
         rank = request.form.get("rank")
 
         new_key = Key(
             character_id=char_id,
+            verse_id=character.verse_id,
             key_name=key_name,
             ap=ap,
             tier=tier,
@@ -185,6 +210,7 @@ def add_key(char_id):
         if rank:
             assign_rank(new_key, character.verse_id, rank)
 
+        refresh_characters([char_id])
         db.session.commit()
 
         return redirect(url_for("main.character_detail", char_id=char_id))
@@ -204,9 +230,11 @@ def add_key(char_id):
 
 # Show all keys
 
-@bp.route("/keys")
-def all_keys():
-    keys = (
+KEYS_PAGE_SIZE = 100
+KEYS_PAGE_MAX = 500
+
+def _key_listing(args):
+    query = (
         db.session.query(
             Key.id,
             Key.key_name,
@@ -215,23 +243,104 @@ def all_keys():
             Key.speed,
             Key.durability,
             Character.name.label("character"),
-            Verse.name.label("verse"),
-            func.group_concat(Hax.name, ", ").label("hax_list")
+            Verse.name.label("verse")
         )
         .select_from(Key)
         .join(Character, Key.character_id == Character.id)
-        .join(Verse, Character.verse_id == Verse.id)
-        .outerjoin(Key.hax)
-        .group_by(Key.id)
-        .order_by(Verse.name, Character.name)
-        .all()
+        .join(Verse, Key.verse_id == Verse.id)
+    )
+
+    verse_id = args.get("verse", type=int)
+    if verse_id:
+        query = query.filter(Key.verse_id == verse_id)
+
+    hax_id = args.get("hax", type=int)
+    if hax_id:
+        query = query.filter(
+            Key.id.in_(
+                select(key_hax_table.c.key_id)
+                .where(key_hax_table.c.hax_id == hax_id)
+            )
+        )
+
+    query = apply_stat_filters(query, args)
+
+    order = [(Verse.name, False), (Character.name, False), (Key.id, False)]
+    sort = stat_sort_key(args)
+    if sort is not None:
+        order.insert(0, (sort, True))
+
+    return query, order
+
+def _cursor(order):
+    try:
+        return decode_cursor(request.args.get("after"), order)
+    except ValueError:
+        abort(400)
+
+@bp.route("/keys")
+@cached(lambda: ("global",))
+def all_keys():
+    limit = min(request.args.get("limit", KEYS_PAGE_SIZE, type=int), KEYS_PAGE_MAX)
+    query, order = _key_listing(request.args)
+    after = _cursor(order)
+    keys, next_values = keyset_page(query, order, after, max(limit, 1))
+
+    args = request.args.to_dict()
+    args.pop("after", None)
+
+    first_url = url_for("main.all_keys", **args) if after is not None else None
+    next_url = None
+    if next_values is not None:
+        next_url = url_for("main.all_keys", **args, after=encode_cursor(next_values))
+
+    return render_template(
+        "keys_all.html",
+        keys=keys,
+        hax_names=hax_names([k.id for k in keys]),
+        first_url=first_url,
+        next_url=next_url,
+        verses=Verse.query.order_by(Verse.name).all(),
+        all_hax=Hax.query.order_by(Hax.name).all(),
+        tiers=TIER_OPTIONS,
+        filters=request.args
     )
 
-    return render_template("keys_all.html", keys=keys)
+# Stream all keys as NDJSON, one keyset page at a time
+
+@bp.route("/keys.ndjson")
+def stream_keys():
+    args = request.args.copy()
+
+    def generate():
+        after = None
+        while True:
+            query, order = _key_listing(args)
+            keys, after = keyset_page(query, order, after, KEYS_PAGE_MAX)
+            names = hax_names([k.id for k in keys])
+
+            for k in keys:
+                yield json.dumps({
+                    "id": k.id,
+                    "verse": k.verse,
+                    "character": k.character,
+                    "key_name": k.key_name,
+                    "tier": k.tier,
+                    "ap": k.ap,
+                    "speed": k.speed,
+                    "durability": k.durability,
+                    "hax": names.get(k.id, [])
+                }) + "\n"
+
+            if after is None:
+                break
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 # Show keys within a verse
 
 @bp.route("/verse/<int:verse_id>")
+@cached(lambda verse_id: (f"verse:{verse_id}", "hax"))
 def verse_detail(verse_id):
     verse = Verse.query.get_or_404(verse_id)
     single = request.args.get("single") == "1"
@@ -242,32 +351,90 @@ def verse_detail(verse_id):
         keys = (
             Key.query
             .join(Character)
-            .filter(Character.verse_id == verse_id)
+            .filter(Key.verse_id == verse_id)
             .options(
                 db.joinedload(Key.character),
-                db.joinedload(Key.hax)
+                db.selectinload(Key.hax)
             )
-            .order_by(Key.rank.asc().nullslast(), Character.name)
-            .all()
         )
 
+        keys = apply_stat_filters(keys, request.args)
 
+        sort = stat_sort(request.args)
+        if sort is not None:
+            keys = keys.order_by(sort, Key.rank.asc().nullslast())
+        else:
+            keys = keys.order_by(Key.rank.asc().nullslast(), Character.name)
 
+        keys = keys.all()
 
     return render_template(
         "verse_detail.html",
         verse=verse,
         keys=keys,
-        single=single
+        positions=rank_positions(verse_id),
+        single=single,
+        tiers=TIER_OPTIONS,
+        filters=request.args
     )
 
 
 # Hax list
 
 @bp.route("/hax")
+@cached(lambda: ("global",))
 def hax_list():
-    hax = Hax.query.order_by(Hax.name).all()
-    return render_template("hax_list.html", hax=hax)
+    return render_template("hax_list.html", hax=hax_usage())
+
+# Hax detail
+
+HAX_DETAIL_LIMIT = 25
+
+@bp.route("/hax/<int:hax_id>")
+@cached(lambda hax_id: ("global",))
+def hax_detail(hax_id):
+    usage = hax_usage(hax_id)
+    if usage is None:
+        abort(404)
+
+    related = cooccurring_hax(hax_id, HAX_DETAIL_LIMIT)
+    keys = (
+        db.session.query(
+            Key.id,
+            Key.key_name,
+            Key.tier,
+            Key.character_id,
+            Character.name.label("character"),
+            Verse.name.label("verse")
+        )
+        .select_from(key_hax_table)
+        .join(Key, Key.id == key_hax_table.c.key_id)
+        .join(Character, Key.character_id == Character.id)
+        .join(Verse, Key.verse_id == Verse.id)
+        .filter(key_hax_table.c.hax_id == hax_id)
+        .order_by(Verse.name, Character.name, Key.id)
+        .limit(HAX_DETAIL_LIMIT)
+        .all()
+    )
+
+    if request.args.get("format") == "json":
+        return {
+            "id": usage.id,
+            "name": usage.name,
+            "keys": usage.keys,
+            "characters": usage.characters,
+            "cooccurring": [
+                {"id": r.id, "name": r.name, "keys": r.keys} for r in related
+            ],
+        }
+
+    return render_template(
+        "hax_detail.html",
+        usage=usage,
+        related=related,
+        keys=keys,
+        limit=HAX_DETAIL_LIMIT
+    )
 
 # Add Hax
 
@@ -294,9 +461,15 @@ def add_hax():
 # Show verses
 
 @bp.route("/verses")
+@cached(lambda: ("global",))
 def verses_list():
     verses = Verse.query.order_by(Verse.name).all()
-    return render_template("verse_list.html", verses=verses)
+    return render_template(
+        "verse_list.html",
+        verses=verses,
+        overview=verse_overview(key_columns()),
+        tiers=TIER_OPTIONS
+    )
 
 # DELETION FUNCTIONS
 
@@ -304,34 +477,21 @@ def verses_list():
 def delete_character(char_id):
     character = Character.query.get_or_404(char_id)
 
+    # the verse's other keys move up into the deleted keys' positions
     db.session.delete(character)
+    refresh_verse_ranks(character.verse_id)
     db.session.commit()
 
     return redirect(url_for("main.index"))
 
 @bp.route("/key/<int:key_id>/delete", methods=["POST"])
+@write_transaction
 def delete_key(key_id):
     key = Key.query.get_or_404(key_id)
-    verse_id = key.character.verse_id
-    old_rank = key.rank
 
+    # ranks are sparse, so the keys below simply move up a position
     db.session.delete(key)
-
-    if old_rank is not None:
-        keys_to_shift = (
-            Key.query
-            .join(Character)
-            .filter(
-                Character.verse_id == verse_id,
-                Key.rank.isnot(None),
-                Key.rank > old_rank
-            )
-            .all()
-        )
-
-        for k in keys_to_shift:
-            k.rank -= 1
-
+    refresh_characters([key.character_id])
     db.session.commit()
     return redirect(url_for("main.character_detail", char_id=key.character_id))
 
@@ -357,6 +517,7 @@ def delete_verse(verse_id):
 # EDIT FUNCTIONS
 
 @bp.route("/character/<int:char_id>/edit", methods=["GET", "POST"])
+@write_transaction
 def edit_character(char_id):
     character = Character.query.get_or_404(char_id)
     verses = Verse.query.order_by(Verse.name).all()
@@ -364,8 +525,10 @@ def edit_character(char_id):
     if request.method == "POST":
         character.name = request.form.get("name", "").strip()
         verse_id = request.form.get("verse_id")
-        if verse_id:
+        if verse_id and int(verse_id) != character.verse_id:
             character.verse_id = int(verse_id)
+            move_character_keys(char_id, character.verse_id)
+            refresh_characters([char_id])
 
         db.session.commit()
         return redirect(url_for("main.character_detail", char_id=char_id))
@@ -377,8 +540,9 @@ def edit_character(char_id):
     )
 
 @bp.route("/key/<int:key_id>/edit", methods=["GET", "POST"])
+@write_transaction
 def edit_key(key_id):
-    key = Key.query.get_or_404(key_id)
+    key = Key.query.options(*KEY_PAGE_LOADING).get_or_404(key_id)
     character = key.character
     verse_id = character.verse_id
 
@@ -394,29 +558,20 @@ def edit_key(key_id):
         key.notes = request.form.get("notes", "").strip()
 
         new_rank = request.form.get("rank")
+        current_rank = rank_position(key, verse_id)
 
-        raw_hax = request.form.getlist("hax_list")
-        hax_objects = []
-
-        for h in raw_hax:
-            if h.isdigit():
-                obj = Hax.query.get(int(h))
-            else:
-                obj = Hax.query.filter_by(name=h).first()
-                if not obj:
-                    obj = Hax(name=h)
-                    db.session.add(obj)
-            hax_objects.append(obj)
+        hax_objects = resolve_hax(request.form.getlist("hax_list"))
 
         if new_rank:
             new_rank = int(new_rank)
-            if new_rank != key.rank:
+            if new_rank != current_rank:
                 assign_rank(key, verse_id, new_rank)
         else:
             key.rank = None
 
         key.hax = hax_objects
 
+        refresh_characters([character.id])
         db.session.commit()
         return redirect(url_for("main.character_detail", char_id=character.id))
 
@@ -426,6 +581,7 @@ def edit_key(key_id):
         "edit_key.html",
         key=key,
         character=character,
+        display_rank=rank_position(key, verse_id),
         AP=AP_OPTIONS,
         durs=DURABILITY_OPTIONS,
         speeds=SPEED_OPTIONS,
@@ -466,54 +622,283 @@ def edit_hax(hax_id):
 
 @bp.route("/compare", methods=["GET", "POST"])
 def compare_keys():
-    # Fetch all keys for dropdowns
-    keys = (
-        db.session.query(
-            Key.id,
-            Key.key_name,
-            Character.name.label("character"),
-            Verse.name.label("verse")
-        )
-        .select_from(Key)
-        .join(Character, Key.character_id == Character.id)
-        .join(Verse, Character.verse_id == Verse.id)
-        .order_by(Verse.name, Character.name, Key.key_name)
-        .all()
-    )
-
+    # keys can also be passed as ?key_a=&key_b= so other pages can link here
+    source = request.form if request.method == "POST" else request.args
+    key_a_id = source.get("key_a", type=int)
+    key_b_id = source.get("key_b", type=int)
 
     key_a = None
     key_b = None
     error = None
 
-    if request.method == "POST":
-        key_a_id = request.form.get("key_a")
-        key_b_id = request.form.get("key_b")
-
+    if request.method == "POST" or key_a_id or key_b_id:
         if not key_a_id or not key_b_id:
             error = "Select two keys to compare."
         elif key_a_id == key_b_id:
             error = "You must select two different keys."
         else:
-            key_a = Key.query.get(key_a_id)
-            key_b = Key.query.get(key_b_id)
+            key_a = Key.query.options(*KEY_PAGE_LOADING).get(key_a_id)
+            key_b = Key.query.options(*KEY_PAGE_LOADING).get(key_b_id)
 
             if not key_a or not key_b:
                 error = "One or both keys could not be found."
 
+    percentiles = (None, None)
+    if key_a and key_b:
+        columns = key_columns()
+        percentiles = (stat_percentiles(columns, key_a.id), stat_percentiles(columns, key_b.id))
+
     return render_template(
         "compare_keys.html",
-        keys=keys,
         key_a=key_a,
         key_b=key_b,
+        percentiles=percentiles,
         error=error
     )
 
+# Key typeahead (Select2 ajax format)
+
+TYPEAHEAD_PAGE_SIZE = 20
+
+@bp.route("/keys/typeahead")
+def key_typeahead():
+    prefix = normalize_name(request.args.get("q", ""))
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    if not prefix:
+        return {"results": [], "pagination": {"more": False}}
+
+    # prefix ranges on the normalized-name indexes, one per table
+    upper = prefix + "\U0010ffff"
+    matches = union(
+        select(Key.id)
+        .join(Character, Key.character_id == Character.id)
+        .where(Character.name_norm >= prefix, Character.name_norm < upper),
+        select(Key.id)
+        .where(Key.key_name_norm >= prefix, Key.key_name_norm < upper)
+    )
+
+    rows = (
+        db.session.query(
+            Key.id,
+            Key.key_name,
+            Character.name.label("character"),
+            Verse.name.label("verse")
+        )
+        .select_from(Key)
+        .join(Character, Key.character_id == Character.id)
+        .join(Verse, Key.verse_id == Verse.id)
+        .filter(Key.id.in_(matches))
+        .order_by(Character.name_norm, Key.key_name_norm, Key.id)
+        .offset((page - 1) * TYPEAHEAD_PAGE_SIZE)
+        .limit(TYPEAHEAD_PAGE_SIZE + 1)
+        .all()
+    )
+
+    return {
+        "results": [
+            {"id": k.id, "text": f"[{k.verse}] {k.character} — {k.key_name}"}
+            for k in rows[:TYPEAHEAD_PAGE_SIZE]
+        ],
+        "pagination": {"more": len(rows) > TYPEAHEAD_PAGE_SIZE}
+    }
+
+# Matchup matrix: every key of side A against every key of side B
+
+MATCHUP_HTML_LIMIT = 100
+
+def _matchup_side(prefix):
+    ids = [int(v) for v in request.args.get(prefix, "").split(",") if v.strip().isdigit()]
+    if ids:
+        return load_side(key_ids=ids)
+
+    verse_id = request.args.get(f"{prefix}_verse", type=int)
+    if verse_id:
+        return load_side(verse_id=verse_id)
+
+    return None
+
+@bp.route("/matchup")
+def matchup():
+    side_a = _matchup_side("a")
+    side_b = _matchup_side("b")
+    as_json = request.args.get("format") == "json"
+
+    if side_a is None or side_b is None:
+        if as_json:
+            return {"error": "Give both sides as a verse (a_verse, b_verse) or key ids (a, b)."}, 400
+        return render_template(
+            "matchup.html",
+            verses=Verse.query.order_by(Verse.name).all(),
+            filters=request.args,
+            side_a=None
+        )
+
+    advantage, shared = matchup_matrix(side_a, side_b)
+    record = summarize(advantage)
+
+    if as_json:
+        return {
+            "a": [{"id": int(i), "label": label} for i, label in zip(side_a.ids, side_a.labels)],
+            "b": [{"id": int(i), "label": label} for i, label in zip(side_b.ids, side_b.labels)],
+            "advantage": advantage.tolist(),
+            "shared_hax": shared.tolist(),
+            "record": {name: counts.tolist() for name, counts in record.items()}
+        }
+
+    return render_template(
+        "matchup.html",
+        verses=Verse.query.order_by(Verse.name).all(),
+        filters=request.args,
+        side_a=side_a,
+        side_b=side_b,
+        advantage=advantage[:MATCHUP_HTML_LIMIT, :MATCHUP_HTML_LIMIT].tolist(),
+        shared=shared[:MATCHUP_HTML_LIMIT, :MATCHUP_HTML_LIMIT].tolist(),
+        record={name: counts.tolist() for name, counts in record.items()},
+        limit=MATCHUP_HTML_LIMIT
+    )
+
+# Stat distributions of every key, or of one verse's or hax's keys
+
+@bp.route("/stats")
+@cached(lambda: ("global",))
+def stats():
+    verse_id = request.args.get("verse_id", type=int)
+    hax_id = request.args.get("hax_id", type=int)
+
+    columns = key_columns()
+    selected = columns.mask(verse_id=verse_id, hax_id=hax_id)
+    distributions = {stat: stat_distribution(columns, stat, selected) for stat in STATS}
+    total = int(selected.sum())
+
+    if request.args.get("format") == "json":
+        return {
+            "verse_id": verse_id,
+            "hax_id": hax_id,
+            "keys": total,
+            "distributions": {
+                stat: [{"value": label, "keys": n} for label, n in rows if n]
+                for stat, rows in distributions.items()
+            }
+        }
+
+    return render_template(
+        "stats.html",
+        distributions=distributions,
+        total=total,
+        verses=Verse.query.order_by(Verse.name).all(),
+        hax=Hax.query.order_by(Hax.name).all(),
+        filters=request.args
+    )
+
+# Keys most like a key, across every verse
+
+SIMILAR_DEFAULT = 10
+SIMILAR_MAX = 100
+
+@bp.route("/key/<int:key_id>/similar")
+@cached(lambda key_id: ("global",))
+def similar(key_id):
+    key = Key.query.options(*KEY_PAGE_LOADING).get_or_404(key_id)
+    limit = min(max(request.args.get("k", SIMILAR_DEFAULT, type=int), 1), SIMILAR_MAX)
+
+    matches = similar_keys(key_columns(), key_id, limit) or []
+    found = {
+        r.id: r
+        for r in db.session.query(
+            Key.id,
+            Key.key_name,
+            Key.ap,
+            Key.tier,
+            Key.durability,
+            Key.speed,
+            Key.character_id,
+            Character.name.label("character"),
+            Verse.name.label("verse")
+        )
+        .join(Character, Key.character_id == Character.id)
+        .join(Verse, Key.verse_id == Verse.id)
+        .filter(Key.id.in_([key_id for key_id, *_ in matches]))
+    }
+    # the snapshot may list a key deleted since it was refreshed
+    rows = [(found[m[0]], *m[1:]) for m in matches if m[0] in found]
+
+    if request.args.get("format") == "json":
+        return {
+            "key_id": key.id,
+            "similar": [
+                {
+                    "id": r.id,
+                    "key_name": r.key_name,
+                    "character_id": r.character_id,
+                    "character": r.character,
+                    "verse": r.verse,
+                    "score": round(score, 4),
+                    "stat_distance": round(distance, 4),
+                    "hax_similarity": round(hax, 4),
+                }
+                for r, score, distance, hax in rows
+            ]
+        }
+
+    return render_template("similar_keys.html", key=key, rows=rows, limit=limit)
+
+# Global leaderboard
+
+LEADERBOARD_PAGE_SIZE = 50
+
+@bp.route("/leaderboard")
+def leaderboard():
+    best_only = request.args.get("all") != "1"
+    start = max(request.args.get("start", 0, type=int), 0)
+    after = _cursor(LEADERBOARD_ORDER)
+
+    query = (
+        db.session.query(
+            LeaderboardEntry.key_id,
+            LeaderboardEntry.character_id,
+            LeaderboardEntry.verse_id,
+            Key.key_name,
+            Key.tier,
+            Key.ap,
+            Key.speed,
+            Key.durability,
+            Character.name.label("character"),
+            Verse.name.label("verse")
+        )
+        .select_from(LeaderboardEntry)
+        .join(Key, LeaderboardEntry.key_id == Key.id)
+        .join(Character, LeaderboardEntry.character_id == Character.id)
+        .join(Verse, LeaderboardEntry.verse_id == Verse.id)
+    )
+    if best_only:
+        # literal IS 1 so SQLite can use the partial ix_leaderboard_best index
+        query = query.filter(LeaderboardEntry.is_best.is_(true()))
+
+    entries, next_values = keyset_page(query, LEADERBOARD_ORDER, after, LEADERBOARD_PAGE_SIZE)
+
+    next_url = None
+    if next_values is not None:
+        next_url = url_for(
+            "main.leaderboard",
+            all=None if best_only else 1,
+            start=start + len(entries),
+            after=encode_cursor(next_values)
+        )
+
+    return render_template(
+        "leaderboard.html",
+        entries=entries,
+        start=start,
+        best_only=best_only,
+        next_url=next_url
+    )
+
 # Prefill key
 
 @bp.route("/key/<int:key_id>/prefill")
 def prefill_key(key_id):
-    key = Key.query.get_or_404(key_id)
+    key = Key.query.options(*KEY_PAGE_LOADING).get_or_404(key_id)
 
     return {
         "ap": key.ap,
@@ -530,6 +915,7 @@ def prefill_key(key_id):
 # resequence ranks
 
 @bp.route("/verse/<int:verse_id>/resequence", methods=["POST"])
+@write_transaction
 def resequence_verse(verse_id):
     verse = Verse.query.get_or_404(verse_id)
 
@@ -537,3 +923,159 @@ def resequence_verse(verse_id):
     db.session.commit()
 
     return redirect(url_for("main.verse_detail", verse_id=verse.id))
+
+# Search
+
+SEARCH_PAGE_SIZE = 25
+
+@bp.route("/search")
+def search():
+    q = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    # one extra row tells us whether there is a next page
+    results = run_search(db.session, q, SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE)
+    has_next = len(results) > SEARCH_PAGE_SIZE
+    results = results[:SEARCH_PAGE_SIZE]
+
+    ids = {}
+    for r in results:
+        ids.setdefault(r["kind"], []).append(r["id"])
+
+    characters = {}
+    if ids.get("character"):
+        characters = {
+            c.id: c for c in
+            Character.query.options(*CHARACTER_ROW_LOADING)
+            .filter(Character.id.in_(ids["character"]))
+        }
+
+    keys = {}
+    if ids.get("key"):
+        keys = {
+            k.id: k for k in
+            Key.query.options(db.joinedload(Key.character))
+            .filter(Key.id.in_(ids["key"]))
+        }
+
+    return render_template(
+        "search.html",
+        q=q,
+        page=page,
+        has_next=has_next,
+        results=results,
+        characters=characters,
+        keys=keys
+    )
+
+# Bulk import / export
+
+@bp.route("/import", methods=["GET", "POST"])
+def bulk_import():
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            return render_template("import.html", error="Choose a CSV or JSONL file.")
+
+        # imported by a background job from a copy of the upload
+        fmt = request.form.get("format") or format_for(upload.filename)
+        if fmt not in FORMATS:
+            return render_template("import.html", error=f"Unknown format {fmt!r}; choose from {', '.join(FORMATS)}.")
+
+        uploads = os.path.join(current_app.instance_path, "uploads")
+        os.makedirs(uploads, exist_ok=True)
+        path = os.path.join(uploads, f"{uuid.uuid4().hex}.{fmt}")
+        upload.save(path)
+
+        job = enqueue("import", path=path, fmt=fmt, cleanup=True)
+        return redirect(url_for("main.job_detail", job_id=job.id))
+
+    return render_template("import.html")
+
+@bp.route("/export.<any(csv, jsonl):fmt>")
+def bulk_export(fmt):
+    body = write_export(export_records(), fmt)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=powerscale.{fmt}"}
+    )
+
+# Background jobs
+
+JOBS_PAGE_SIZE = 50
+
+# the jobs /jobs may start, with the form fields each one takes; imports are
+# only queued by /import, which picks the file path itself
+JOB_FORM_PARAMS = {
+    "resequence": ("verse_id",),
+    "rebuild": ("target",),
+    "compact_changes": (),
+}
+
+@bp.route("/jobs", methods=["GET", "POST"])
+def jobs():
+    error = None
+    if request.method == "POST":
+        kind = request.form.get("kind", "")
+        if kind not in JOB_FORM_PARAMS:
+            error = f"Unknown job {kind!r}; choose from {', '.join(JOB_FORM_PARAMS)}."
+        else:
+            params = {
+                name: request.form[name] for name in JOB_FORM_PARAMS[kind]
+                if request.form.get(name)
+            }
+            try:
+                job = enqueue(kind, **params)
+            except ValueError as exc:
+                error = str(exc)
+            else:
+                return redirect(url_for("main.job_detail", job_id=job.id))
+
+    return render_template(
+        "jobs.html",
+        jobs=Job.query.order_by(Job.id.desc()).limit(JOBS_PAGE_SIZE).all(),
+        verses=Verse.query.order_by(Verse.name).all(),
+        rebuilds=REBUILDS,
+        error=error
+    )
+
+@bp.route("/jobs/<int:job_id>")
+def job_detail(job_id):
+    job = Job.query.get_or_404(job_id)
+
+    if request.args.get("format") == "json":
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "params": job.params,
+            "status": job.status,
+            "done": job.done,
+            "total": job.total,
+            "percent": job.percent,
+            "message": job.message,
+            "result": job.result,
+            "cancel_requested": job.cancel_requested,
+            "created_at": job.created_at.isoformat(),
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+
+    return render_template("job_detail.html", job=job)
+
+@bp.route("/jobs/<int:job_id>/cancel", methods=["POST"])
+def cancel_job_route(job_id):
+    Job.query.get_or_404(job_id)
+    cancel_job(job_id)
+    return redirect(url_for("main.job_detail", job_id=job_id))
+
+# Prometheus metrics
+
+@bp.route("/metrics")
+def metrics():
+    return Response(
+        render_metrics(current_app.extensions["metrics"]),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,414 @@
+import csv
+import io
+import json
+import time
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from app.models import db, Verse, Character, Key, Hax, key_hax_table, normalize_name
+from app.powerstats import stat_fields, tier_from_ap
+from app.utils.hax import hax_ids_by_name, hax_names
+from app.utils.leaderboard import refresh_characters
+from app.utils.pagination import keyset_page
+from app.utils.ranking import RANK_GAP, claim_verse_ranks, rank_position_column, tail_rank
+from app.utils.transactions import begin_write
+
+# Bulk import/export of the catalog as CSV or JSON lines, one row per key:
+#
+#   verse, character, key_name, ap, tier, durability, speed, rank, notes, hax
+#
+# A row without key_name only creates its verse and character (or, with no
+# verse either, just its hax). hax is a list in JSONL and "|"-separated in CSV.
+# rank is a sort key: imported keys of a verse are ordered by it and placed
+# after the keys the verse already has ranked. Exports write each key's
+# displayed rank (1, 2, 3... within its verse), not the internal sort key.
+#
+# Rows are read lazily and processed in chunks, one transaction per chunk:
+# verses, characters and hax are resolved with one query per kind and the
+# keys and their hax links are inserted with executemany.
+
+FIELDS = ["verse", "character", "key_name", "ap", "tier", "durability", "speed", "rank", "notes", "hax"]
+FORMATS = ("csv", "jsonl")
+HAX_SEPARATOR = "|"
+
+CHUNK_SIZE = 1000
+EXPORT_PAGE_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+def format_for(filename):
+    name = (filename or "").lower()
+    return "jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+# Parsing
+
+def read_records(stream, fmt):
+    # yields (line number, record or error message)
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_no, f"invalid JSON: {exc}"
+            continue
+        yield line_no, record if isinstance(record, dict) else "expected a JSON object"
+
+def _text(record, field):
+    value = record.get(field)
+    return str(value).strip() if value is not None else ""
+
+def _rank(value):
+    try:
+        return int(float(value))
+    except (ValueError, OverflowError):
+        # "inf" overflows and "nan" has no integer value
+        raise ValueError(f"invalid rank: {value!r}") from None
+
+def _clean(record):
+    row = {field: _text(record, field) for field in FIELDS if field not in ("rank", "hax")}
+
+    hax = record.get("hax") or []
+    if isinstance(hax, str):
+        hax = hax.split(HAX_SEPARATOR)
+    row["hax"] = list(dict.fromkeys(str(h).strip() for h in hax if str(h).strip()))
+
+    rank = _text(record, "rank")
+    row["rank"] = _rank(rank) if rank else None
+
+    if row["key_name"] and not row["ap"]:
+        raise ValueError("a key needs an ap value")
+    if row["key_name"] and not row["character"]:
+        raise ValueError("a key needs a character")
+    if row["character"] and not row["verse"]:
+        raise ValueError("a character needs a verse")
+    if not row["verse"] and not row["hax"]:
+        raise ValueError("empty row")
+
+    return row
+
+# Import
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.verses = 0
+        self.characters = 0
+        self.keys = 0
+        self.hax = 0
+        self.chunks = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line_no, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line_no}: {message}")
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (
+            f"{self.rows} rows in {self.elapsed:.2f}s ({self.rows_per_second:.0f} rows/s): "
+            f"{self.verses} verses, {self.characters} characters, {self.keys} keys, "
+            f"{self.hax} hax created; {self.skipped} rows skipped"
+        )
+
+class _Importer:
+    def __init__(self, report):
+        self.report = report
+        self.verse_ids = {}
+        self.character_ids = {}
+        # per verse: last rank handed out, and (file rank, row, key id, rank, character id)
+        # of the keys imported with a rank
+        self.rank_tail = {}
+        self.ranked = {}
+
+    def _resolve_verses(self, names):
+        missing = names - self.verse_ids.keys()
+        if not missing:
+            return
+
+        lookup = select(Verse.name, Verse.id).where(Verse.name.in_(missing))
+        self.verse_ids.update(db.session.execute(lookup).all())
+
+        new = missing - self.verse_ids.keys()
+        if new:
+            db.session.execute(
+                insert(Verse)
+                .values([{"name": name} for name in sorted(new)])
+                .on_conflict_do_nothing(index_elements=["name"])
+            )
+            self.verse_ids.update(db.session.execute(lookup.where(Verse.name.in_(new))).all())
+            self.report.verses += len(new)
+
+    def _resolve_characters(self, pairs):
+        missing = pairs - self.character_ids.keys()
+        if not missing:
+            return
+
+        existing = db.session.execute(
+            select(Character.verse_id, Character.name, func.min(Character.id))
+            .where(
+                Character.verse_id.in_({verse_id for verse_id, _ in missing}),
+                Character.name.in_({name for _, name in missing})
+            )
+            .group_by(Character.verse_id, Character.name)
+        )
+        for verse_id, name, char_id in existing:
+            if (verse_id, name) in missing:
+                self.character_ids[(verse_id, name)] = char_id
+
+        new = sorted(missing - self.character_ids.keys())
+        if new:
+            ids = db.session.scalars(
+                insert(Character.__table__).returning(Character.id, sort_by_parameter_order=True),
+                [{"verse_id": v, "name": n, "name_norm": normalize_name(n)} for v, n in new]
+            ).all()
+            self.character_ids.update(zip(new, ids))
+            self.report.characters += len(new)
+
+    def _next_rank(self, verse_id):
+        if verse_id not in self.rank_tail:
+            claim_verse_ranks(verse_id)
+            self.rank_tail[verse_id] = tail_rank(verse_id)
+        self.rank_tail[verse_id] += RANK_GAP
+        return self.rank_tail[verse_id]
+
+    def import_chunk(self, rows):
+        # each chunk holds the write lock from its first read, and reads the
+        # verses' last ranks afresh in case other writers appended keys
+        begin_write()
+        self.rank_tail = {}
+
+        self._resolve_verses({row["verse"] for _, row in rows if row["verse"]})
+        self._resolve_characters({
+            (self.verse_ids[row["verse"]], row["character"])
+            for _, row in rows if row["character"]
+        })
+
+        before = db.session.scalar(select(func.count(Hax.id)))
+        hax_ids = hax_ids_by_name({name for _, row in rows for name in row["hax"]})
+        self.report.hax += db.session.scalar(select(func.count(Hax.id))) - before
+
+        keys, key_rows = [], []
+        for line_no, row in rows:
+            if not row["key_name"]:
+                continue
+
+            verse_id = self.verse_ids[row["verse"]]
+            stats = {
+                "ap": row["ap"],
+                "tier": row["tier"] or tier_from_ap(row["ap"]),
+                "durability": row["durability"] or row["ap"],
+                "speed": row["speed"],
+            }
+            keys.append({
+                "character_id": self.character_ids[(verse_id, row["character"])],
+                "verse_id": verse_id,
+                "key_name": row["key_name"],
+                "key_name_norm": normalize_name(row["key_name"]),
+                "notes": row["notes"],
+                "rank": self._next_rank(verse_id) if row["rank"] is not None else None,
+                **stats,
+                **{
+                    column: derived
+                    for stat, value in stats.items()
+                    for column, derived in stat_fields(stat, value).items()
+                },
+            })
+            key_rows.append((line_no, row))
+
+        if keys:
+            # Core table inserts: ORM bulk inserts split batches on NULL ranks
+            key_ids = db.session.scalars(
+                insert(Key.__table__).returning(Key.id, sort_by_parameter_order=True), keys
+            ).all()
+
+            links = [
+                {"key_id": key_id, "hax_id": hax_ids[name]}
+                for key_id, (_, row) in zip(key_ids, key_rows)
+                for name in row["hax"]
+            ]
+            if links:
+                db.session.execute(insert(key_hax_table).on_conflict_do_nothing(), links)
+
+            for key_id, values, (line_no, row) in zip(key_ids, keys, key_rows):
+                if values["rank"] is not None:
+                    self.ranked.setdefault(values["verse_id"], []).append(
+                        (row["rank"], line_no, key_id, values["rank"], values["character_id"])
+                    )
+
+            refresh_characters({values["character_id"] for values in keys})
+            self.report.keys += len(keys)
+
+        db.session.commit()
+        self.report.chunks += 1
+
+    def order_ranks(self):
+        # keys got ranks in file order; reorder them by the file's rank column
+        # by handing the same rank values out again in sorted order
+        begin_write()
+        moved = set()
+        for verse_id, entries in self.ranked.items():
+            wanted = sorted(entries)
+            if wanted == entries:
+                continue
+
+            # swapping ranks row by row would trip the unique (verse_id, rank)
+            # index, so write them negated and flip them afterwards
+            ranks = [entry[3] for entry in entries]
+            db.session.execute(
+                update(Key.__table__)
+                .where(Key.__table__.c.id == bindparam("key_id"))
+                .values(rank=bindparam("new_rank")),
+                [{"key_id": entry[2], "new_rank": -rank} for entry, rank in zip(wanted, ranks)]
+            )
+            db.session.execute(
+                update(Key.__table__)
+                .where(Key.__table__.c.verse_id == verse_id, Key.__table__.c.rank < 0)
+                .values(rank=-Key.__table__.c.rank)
+            )
+            moved.update(entry[4] for entry in entries)
+
+        # verse ranks break ties between a character's keys, so best keys may change
+        refresh_characters(moved)
+
+        db.session.commit()
+
+def import_records(records, chunk_size=CHUNK_SIZE, progress=None):
+    report = ImportReport()
+    importer = _Importer(report)
+
+    chunk = []
+    try:
+        for line_no, record in records:
+            report.rows += 1
+            if isinstance(record, str):
+                report.error(line_no, record)
+                continue
+            try:
+                chunk.append((line_no, _clean(record)))
+            except ValueError as exc:
+                report.error(line_no, exc)
+                continue
+
+            if len(chunk) >= chunk_size:
+                importer.import_chunk(chunk)
+                chunk = []
+                report.elapsed = time.perf_counter() - report.started
+                if progress:
+                    progress(report)
+
+        if chunk:
+            importer.import_chunk(chunk)
+        importer.order_ranks()
+    except Exception:
+        # chunks already committed stay imported
+        db.session.rollback()
+        raise
+
+    report.elapsed = time.perf_counter() - report.started
+    if progress:
+        progress(report)
+    return report
+
+def import_stream(stream, fmt, chunk_size=CHUNK_SIZE, progress=None):
+    return import_records(read_records(stream, fmt), chunk_size, progress)
+
+# Export
+
+def export_records():
+    query = (
+        db.session.query(
+            Key.id, Verse.name.label("verse"), Character.name.label("character"),
+            Key.key_name, Key.ap, Key.tier, Key.durability, Key.speed,
+            rank_position_column().label("rank"), Key.notes
+        )
+        .select_from(Key)
+        .join(Character, Key.character_id == Character.id)
+        .join(Verse, Key.verse_id == Verse.id)
+    )
+
+    after = None
+    while True:
+        keys, after = keyset_page(query, [(Key.id, False)], after, EXPORT_PAGE_SIZE)
+        names = hax_names([k.id for k in keys])
+
+        for k in keys:
+            yield {
+                "verse": k.verse,
+                "character": k.character,
+                "key_name": k.key_name,
+                "ap": k.ap,
+                "tier": k.tier,
+                "durability": k.durability,
+                "speed": k.speed,
+                "rank": k.rank,
+                "notes": k.notes,
+                "hax": names.get(k.id, []),
+            }
+
+        if after is None:
+            break
+
+    # rows that carry no key, so a re-import recreates them too
+    leftovers = (
+        select(Verse.name, Character.name)
+        .select_from(Character)
+        .join(Verse, Character.verse_id == Verse.id)
+        .where(~select(Key.id).where(Key.character_id == Character.id).exists())
+        .union_all(
+            select(Verse.name, None)
+            .where(~select(Character.id).where(Character.verse_id == Verse.id).exists())
+        )
+    )
+    for verse, character in db.session.execute(leftovers.execution_options(yield_per=EXPORT_PAGE_SIZE)):
+        yield {"verse": verse, "character": character, "hax": []}
+
+    unused = select(Hax.name).where(~select(key_hax_table.c.key_id).where(key_hax_table.c.hax_id == Hax.id).exists())
+    for name in db.session.scalars(unused.execution_options(yield_per=EXPORT_PAGE_SIZE)):
+        yield {"hax": [name]}
+
+def _batched(lines, size=64 * 1024):
+    buffer = []
+    total = 0
+    for line in lines:
+        buffer.append(line)
+        total += len(line)
+        if total >= size:
+            yield "".join(buffer)
+            buffer, total = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+def _csv_lines(records):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, FIELDS, extrasaction="ignore")
+
+    writer.writeheader()
+    yield out.getvalue()
+    out.seek(0)
+    out.truncate()
+
+    for record in records:
+        writer.writerow({**record, "hax": HAX_SEPARATOR.join(record.get("hax", []))})
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+
+def _jsonl_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+def write_export(records, fmt):
+    lines = _csv_lines(records) if fmt == "csv" else _jsonl_lines(records)
+    return _batched(lines)
@@ -0,0 +1,270 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, has_app_context, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.models import Verse, Character, Key, Hax, key_hax_table
+
+# Response cache for read-heavy pages. Each cached page names the data scopes
+# it depends on, and its cache key includes the current version of each scope:
+#
+#   "verses"      verse names (Verse rows)
+#   "verse:<id>"  one verse, its characters and keys
+#   "hax"         hax names and hax links
+#   "global"      anything tracked below
+#   "all"         part of every key; bumped by bulk (Core) writes
+#
+# Versions are bumped after commit, from the objects the session flushed, so a
+# write simply makes the old entries unreachable and LRU eviction drops them.
+# A hit reads the versions and the entry from the cache backend only.
+#
+# The same versions give conditional responses a strong ETag without running
+# the view. Versions restart when the backend does, so each backend also has
+# an epoch that is part of every ETag.
+
+_TRACKED_TABLES = {"verses", "characters", "keys", "hax", key_hax_table.name}
+
+class MemoryCache:
+    # per-process LRU bounded by entry count, total body size and age. Version
+    # bumps stay in the process that wrote, so this is for a single process:
+    # with several workers another worker's pages can be up to ttl seconds
+    # stale. Use a shared backend there.
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.versions = {}
+        self.epoch = uuid.uuid4().hex
+        self.lock = threading.Lock()
+
+    def get_versions(self, scopes):
+        with self.lock:
+            return [self.versions.get(scope, 0) for scope in scopes]
+
+    def bump(self, scopes):
+        with self.lock:
+            for scope in scopes:
+                self.versions[scope] = self.versions.get(scope, 0) + 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                del self.entries[key]
+                self.size -= len(entry[0])
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[:2]
+
+    def set(self, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+
+            self.entries[key] = (body, mimetype, time.monotonic() + self.ttl)
+            self.size += len(body)
+
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (evicted, _, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+class RedisCache:
+    # shared between workers; configure Redis with an LRU maxmemory-policy
+    def __init__(self, url, ttl, prefix="powerscale:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_URL points at Redis but the redis package is not installed")
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+        # shared by every worker; created by whichever starts first
+        self.client.set(f"{prefix}epoch", uuid.uuid4().hex, nx=True)
+        self.epoch = self.client.get(f"{prefix}epoch").decode()
+
+    def get_versions(self, scopes):
+        values = self.client.mget([f"{self.prefix}version:{scope}" for scope in scopes])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def bump(self, scopes):
+        pipe = self.client.pipeline()
+        for scope in scopes:
+            pipe.incr(f"{self.prefix}version:{scope}")
+        pipe.execute()
+
+    def get(self, key):
+        values = self.client.hmget(f"{self.prefix}page:{key}", "body", "mimetype")
+        if values[0] is None:
+            return None
+        return values[0], values[1].decode()
+
+    def set(self, key, body, mimetype):
+        name = f"{self.prefix}page:{key}"
+        pipe = self.client.pipeline()
+        pipe.hset(name, mapping={"body": body, "mimetype": mimetype})
+        pipe.expire(name, self.ttl)
+        pipe.execute()
+
+def init_cache(app):
+    url = app.config.get("RESPONSE_CACHE_URL")
+
+    if not url:
+        backend = None
+    elif url.startswith("memory://"):
+        backend = MemoryCache(
+            app.config["RESPONSE_CACHE_MAX_ENTRIES"],
+            app.config["RESPONSE_CACHE_MAX_BYTES"],
+            app.config["RESPONSE_CACHE_TTL"]
+        )
+    else:
+        backend = RedisCache(url, app.config["RESPONSE_CACHE_TTL"])
+
+    app.extensions["response_cache"] = backend
+
+def _backend():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("response_cache")
+
+def bump(*scopes):
+    backend = _backend()
+    if backend is not None:
+        backend.bump(scopes)
+
+def _page_key(backend, scopes, kwargs):
+    names = ("all", *scopes)
+    versions = backend.get_versions(names)
+    return "|".join([
+        request.endpoint,
+        *(f"{k}={v}" for k, v in sorted(kwargs.items())),
+        request.query_string.decode(),
+        *(f"{n}@{v}" for n, v in zip(names, versions)),
+    ])
+
+def cached(scopes):
+    # scopes: function of the view arguments returning the scopes the page reads
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            backend = _backend()
+            if backend is None or request.method != "GET":
+                return view(**kwargs)
+
+            key = _page_key(backend, scopes(**kwargs), kwargs)
+            entry = backend.get(key)
+            if entry is not None:
+                response = Response(entry[0], mimetype=entry[1])
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            response = current_app.make_response(view(**kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                backend.set(key, response.get_data(), response.mimetype)
+                response.headers["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+    return decorator
+
+def conditional(scopes):
+    # strong ETag from the scope versions, so a matching If-None-Match is a
+    # 304 without touching the database; without a cache backend the ETag is
+    # a hash of the body, which saves the transfer but not the work
+    def headers(response, etag):
+        if etag is not None:
+            response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["API_MAX_AGE"]
+        response.cache_control.must_revalidate = True
+        return response
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            backend = _backend()
+            etag = None
+
+            if backend is not None:
+                key = _page_key(backend, scopes(**kwargs), kwargs)
+                etag = hashlib.sha1(f"{backend.epoch}|{key}".encode()).hexdigest()
+                if request.if_none_match.contains(etag):
+                    return headers(Response(status=304), etag)
+
+            response = current_app.make_response(view(**kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            if etag is None:
+                response.add_etag()
+            return headers(response, etag).make_conditional(request)
+
+        return wrapper
+    return decorator
+
+# Invalidation
+
+def _verse_ids(obj):
+    if isinstance(obj, Verse):
+        return {obj.id}
+
+    history = inspect(obj).attrs.verse_id.history
+    return {v for v in (*history.added, *history.unchanged, *history.deleted) if v is not None}
+
+def _pending(session):
+    return session.info.setdefault("cache_scopes", set())
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed(session, _):
+    scopes = set()
+
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Hax):
+            # relinking hax dirties the Hax too; the Key covers that
+            if obj in session.dirty and not inspect(obj).attrs.name.history.has_changes():
+                continue
+            scopes.add("hax")
+        elif isinstance(obj, (Verse, Character, Key)):
+            verse_ids = _verse_ids(obj)
+            scopes.update(f"verse:{verse_id}" for verse_id in verse_ids)
+            if isinstance(obj, Verse):
+                scopes.add("verses")
+            if not verse_ids:
+                scopes.add("all")
+        else:
+            continue
+        scopes.add("global")
+
+    _pending(session).update(scopes)
+
+@event.listens_for(Session, "do_orm_execute")
+def _record_bulk_write(state):
+    # UPDATE/INSERT/DELETE statements bypass the flush, so invalidate everything
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if table is not None and table.name in _TRACKED_TABLES:
+            _pending(state.session).add("all")
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session):
+    scopes = session.info.pop("cache_scopes", None)
+    if scopes:
+        bump(*scopes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("cache_scopes", None)
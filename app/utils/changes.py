@@ -0,0 +1,82 @@
+from sqlalchemy import select, text
+from app.models import Change, Verse, Character, Key, Hax
+
+# Change feed: triggers append a row to the changes table for every insert,
+# update and delete of a tracked entity, so Core writes, imports and
+# ON DELETE CASCADE are logged as well as ORM flushes. Clients keep the last
+# seq they applied and ask for what came after it.
+#
+# Compaction drops rows superseded by a later change of the same entity. A
+# client only needs each entity's latest change, so any seq stays a valid
+# starting point, and the log stays one row per entity ever created.
+
+CHANGE_ENTITIES = {
+    # entity: (model, table)
+    "verse": (Verse, "verses"),
+    "character": (Character, "characters"),
+    "key": (Key, "keys"),
+    "hax": (Hax, "hax"),
+}
+
+def _log(entity, entity_id, op):
+    return f"INSERT INTO changes(entity, entity_id, op) VALUES ('{entity}', {entity_id}, '{op}');"
+
+def install_change_triggers(conn):
+    for entity, (_, table) in CHANGE_ENTITIES.items():
+        for event, row, op in (("INSERT", "new", "upsert"), ("UPDATE", "new", "upsert"), ("DELETE", "old", "delete")):
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS changes_{table}_{event[0].lower()} "
+                f"AFTER {event} ON {table} BEGIN {_log(entity, f'{row}.id', op)} END"
+            ))
+
+    # a key's hax are part of the key; links removed along with a deleted key
+    # are covered by the key's own delete
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS changes_key_hax_i AFTER INSERT ON key_hax "
+        f"BEGIN {_log('key', 'new.key_id', 'upsert')} END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS changes_key_hax_d AFTER DELETE ON key_hax "
+        "WHEN EXISTS (SELECT 1 FROM keys WHERE id = old.key_id) "
+        f"BEGIN {_log('key', 'old.key_id', 'upsert')} END"
+    ))
+
+def seed_change_log(conn):
+    # an upsert for every existing row, so reading from seq 0 is a full sync
+    for entity, (_, table) in CHANGE_ENTITIES.items():
+        conn.execute(text(
+            f"INSERT INTO changes(entity, entity_id, op) "
+            f"SELECT '{entity}', id, 'upsert' FROM {table} ORDER BY id"
+        ))
+
+def latest_seq(session):
+    # the last seq handed out, which compaction may have removed from the log
+    return session.scalar(text("SELECT seq FROM sqlite_sequence WHERE name = 'changes'")) or 0
+
+def changes_since(session, since, limit):
+    # up to limit log rows after since, coalesced to the last op per entity;
+    # returns ({entity: {id: op}}, seq to continue from, whether more rows follow).
+    # The last batch continues from latest_seq, past any compacted rows.
+    rows = session.execute(
+        select(Change.seq, Change.entity, Change.entity_id, Change.op)
+        .where(Change.seq > since)
+        .order_by(Change.seq)
+        .limit(limit + 1)
+    ).all()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    ops = {entity: {} for entity in CHANGE_ENTITIES}
+    for _, entity, entity_id, op in rows:
+        ops[entity][entity_id] = op
+
+    return ops, (rows[-1].seq if more else max(latest_seq(session), since)), more
+
+def compact_changes(conn):
+    # returns the number of rows removed
+    return conn.execute(text(
+        "DELETE FROM changes WHERE seq < ("
+        "SELECT max(later.seq) FROM changes AS later "
+        "WHERE later.entity = changes.entity AND later.entity_id = changes.entity_id)"
+    )).rowcount
@@ -0,0 +1,50 @@
+from sqlalchemy import func
+from app.models import Key
+from app.powerstats import STAT_ORDINALS, stat_interval
+
+STAT_RANGES = {
+    "tier": (Key.tier_low, Key.tier_high),
+    "ap": (Key.ap_low, Key.ap_high),
+    "durability": (Key.durability_low, Key.durability_high),
+    "speed": (Key.speed_low, Key.speed_high),
+}
+
+STAT_COLUMNS = {
+    "tier": Key.tier_ord,
+    "ap": Key.ap_ord,
+    "durability": Key.durability_ord,
+    "speed": Key.speed_ord,
+}
+
+def apply_stat_filters(query, args):
+    # ?min_tier=5-B&max_ap=Star etc. become ordinal range predicates
+    for stat, column in STAT_COLUMNS.items():
+        low = STAT_ORDINALS[stat].get(args.get(f"min_{stat}"))
+        high = STAT_ORDINALS[stat].get(args.get(f"max_{stat}"))
+
+        if low is not None:
+            query = query.filter(column >= low)
+        if high is not None:
+            query = query.filter(column <= high)
+
+    # ?ap_range=Star to Solar System: keys whose parsed interval overlaps it
+    for stat, (low_column, high_column) in STAT_RANGES.items():
+        interval = stat_interval(stat, args.get(f"{stat}_range"))
+        if interval is not None:
+            query = query.filter(low_column <= interval[1], high_column >= interval[0])
+
+    return query
+
+def stat_sort(args):
+    # strongest first, unknown values last
+    column = STAT_COLUMNS.get(args.get("sort"))
+    if column is None:
+        return None
+    return column.desc().nullslast()
+
+def stat_sort_key(args):
+    # NULL-free variant of stat_sort for keyset pagination; sort descending
+    column = STAT_COLUMNS.get(args.get("sort"))
+    if column is None:
+        return None
+    return func.coalesce(column, -1)
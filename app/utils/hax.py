@@ -0,0 +1,141 @@
+from sqlalchemy import distinct, func, select, text
+from sqlalchemy.dialects.sqlite import insert
+from app.models import db, Hax, HaxCooccurrence, Key, key_hax_table
+
+def insert_missing_hax(names):
+    # another request may have just created the same name, so ignore
+    # conflicts on the unique constraint; callers read back whichever row won
+    db.session.execute(
+        insert(Hax)
+        .values([{"name": name} for name in sorted(names)])
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+
+def hax_ids_by_name(names):
+    names = set(names)
+    if not names:
+        return {}
+
+    lookup = select(Hax.name, Hax.id).where(Hax.name.in_(names))
+    ids = dict(db.session.execute(lookup).all())
+
+    missing = names - ids.keys()
+    if missing:
+        insert_missing_hax(missing)
+        ids.update(db.session.execute(lookup.where(Hax.name.in_(missing))).all())
+
+    return ids
+
+def resolve_hax(raw_values):
+    # Form values are existing hax ids or names typed into Select2.
+    # Looks everything up with one IN query per kind and creates missing names in bulk.
+    values = [v.strip() for v in raw_values if v and v.strip()]
+
+    ids = {int(v) for v in values if v.isdigit()}
+    names = {v for v in values if not v.isdigit()}
+
+    by_id = {}
+    if ids:
+        by_id = {h.id: h for h in Hax.query.filter(Hax.id.in_(ids))}
+
+    by_name = {}
+    if names:
+        by_name = {h.name: h for h in Hax.query.filter(Hax.name.in_(names))}
+
+    missing = names - by_name.keys()
+    if missing:
+        insert_missing_hax(missing)
+        by_name.update(
+            (h.name, h) for h in Hax.query.filter(Hax.name.in_(missing))
+        )
+
+    hax_objects = []
+    for v in values:
+        obj = by_id.get(int(v)) if v.isdigit() else by_name.get(v)
+        if obj is not None and obj not in hax_objects:
+            hax_objects.append(obj)
+
+    return hax_objects
+
+def hax_names(key_ids):
+    rows = (
+        db.session.query(key_hax_table.c.key_id, Hax.name)
+        .join(Hax, key_hax_table.c.hax_id == Hax.id)
+        .filter(key_hax_table.c.key_id.in_(key_ids))
+        .order_by(Hax.name)
+    )
+
+    names = {}
+    for key_id, name in rows:
+        names.setdefault(key_id, []).append(name)
+    return names
+
+# Usage statistics
+
+def hax_usage(hax_id=None):
+    # (id, name, keys, characters) per hax from one grouped query over key_hax
+    query = (
+        db.session.query(
+            Hax.id,
+            Hax.name,
+            func.count(key_hax_table.c.key_id).label("keys"),
+            func.count(distinct(Key.character_id)).label("characters")
+        )
+        .outerjoin(key_hax_table, key_hax_table.c.hax_id == Hax.id)
+        .outerjoin(Key, Key.id == key_hax_table.c.key_id)
+        .group_by(Hax.id)
+        .order_by(Hax.name)
+    )
+
+    if hax_id is not None:
+        return query.filter(Hax.id == hax_id).first()
+    return query.all()
+
+def cooccurring_hax(hax_id, limit):
+    return (
+        db.session.query(Hax.id, Hax.name, HaxCooccurrence.keys)
+        .join(Hax, Hax.id == HaxCooccurrence.other_id)
+        .filter(HaxCooccurrence.hax_id == hax_id)
+        .order_by(HaxCooccurrence.keys.desc(), Hax.name)
+        .limit(limit)
+        .all()
+    )
+
+# hax_cooccurrence is kept in step with key_hax by triggers, so every write
+# path (forms, bulk import, cascaded deletes) updates it the same way.
+# After a link is removed, the key's remaining hax are exactly the pairs to
+# decrement.
+
+_PAIR_TRIGGERS = {
+    "hax_pairs_ai": (
+        "AFTER INSERT ON key_hax BEGIN "
+        "INSERT INTO hax_cooccurrence (hax_id, other_id, keys) "
+        "SELECT new.hax_id, hax_id, 1 FROM key_hax WHERE key_id = new.key_id AND hax_id != new.hax_id "
+        "ON CONFLICT (hax_id, other_id) DO UPDATE SET keys = keys + 1; "
+        "INSERT INTO hax_cooccurrence (hax_id, other_id, keys) "
+        "SELECT hax_id, new.hax_id, 1 FROM key_hax WHERE key_id = new.key_id AND hax_id != new.hax_id "
+        "ON CONFLICT (hax_id, other_id) DO UPDATE SET keys = keys + 1; "
+        "END"
+    ),
+    "hax_pairs_ad": (
+        "AFTER DELETE ON key_hax BEGIN "
+        "UPDATE hax_cooccurrence SET keys = keys - 1 "
+        "WHERE (hax_id = old.hax_id AND other_id IN (SELECT hax_id FROM key_hax WHERE key_id = old.key_id)) "
+        "OR (other_id = old.hax_id AND hax_id IN (SELECT hax_id FROM key_hax WHERE key_id = old.key_id)); "
+        "DELETE FROM hax_cooccurrence WHERE keys <= 0 AND (hax_id = old.hax_id OR other_id = old.hax_id); "
+        "END"
+    ),
+}
+
+def install_cooccurrence_triggers(conn):
+    for name, body in _PAIR_TRIGGERS.items():
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {body}"))
+
+def rebuild_cooccurrence(conn):
+    conn.execute(text("DELETE FROM hax_cooccurrence"))
+    conn.execute(text(
+        "INSERT INTO hax_cooccurrence (hax_id, other_id, keys) "
+        "SELECT a.hax_id, b.hax_id, count(*) FROM key_hax a "
+        "JOIN key_hax b ON b.key_id = a.key_id AND b.hax_id != a.hax_id "
+        "GROUP BY a.hax_id, b.hax_id"
+    ))
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import Counter
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+# Per-request cost accounting. Cursor events count queries and DB time,
+# template signals time rendering, and request hooks fold both into
+# per-endpoint totals that /metrics serves in Prometheus text format.
+# Statements slower than SLOW_QUERY_MS are logged with their query plan;
+# the same statement run N_PLUS_ONE_THRESHOLD or more times in one request
+# is logged as a suspected N+1. Totals are per process.
+
+logger = logging.getLogger(__name__)
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()      # (endpoint, method, status)
+        self.queries = Counter()       # endpoint
+        self.db_seconds = Counter()
+        self.render_seconds = Counter()
+        self.request_seconds = Counter()
+        self.slow_queries = Counter()
+        self.n_plus_one = Counter()
+        self.buckets = {}              # endpoint: per-bucket counts
+
+    def record_request(self, endpoint, method, status, seconds, queries, db_seconds, render_seconds):
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.queries[endpoint] += queries
+            self.db_seconds[endpoint] += db_seconds
+            self.render_seconds[endpoint] += render_seconds
+            self.request_seconds[endpoint] += seconds
+
+            counts = self.buckets.setdefault(endpoint, [0] * len(REQUEST_BUCKETS))
+            for i, bound in enumerate(REQUEST_BUCKETS):
+                if seconds <= bound:
+                    counts[i] += 1
+
+    def record(self, counter, endpoint, amount=1):
+        with self.lock:
+            getattr(self, counter)[endpoint] += amount
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def render_metrics(metrics):
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+
+    with metrics.lock:
+        family("powerscale_requests_total", "counter", "Requests handled.", [
+            f"powerscale_requests_total{_labels(endpoint=e, method=m, status=s)} {n}"
+            for (e, m, s), n in sorted(metrics.requests.items())
+        ])
+
+        for name, counter, help_text in (
+            ("powerscale_db_queries_total", metrics.queries, "SQL statements executed."),
+            ("powerscale_db_seconds_total", metrics.db_seconds, "Time spent executing SQL."),
+            ("powerscale_render_seconds_total", metrics.render_seconds, "Time spent rendering templates."),
+            ("powerscale_slow_queries_total", metrics.slow_queries, "Statements slower than SLOW_QUERY_MS."),
+            ("powerscale_n_plus_one_total", metrics.n_plus_one, "Requests that repeated one statement N_PLUS_ONE_THRESHOLD or more times."),
+        ):
+            family(name, "counter", help_text, [
+                f"{name}{_labels(endpoint=e)} {value:.6g}" for e, value in sorted(counter.items())
+            ])
+
+        samples = []
+        for endpoint, counts in sorted(metrics.buckets.items()):
+            for bound, count in zip(REQUEST_BUCKETS, counts):
+                samples.append(f"powerscale_request_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {count}")
+            total = sum(n for (e, _, _), n in metrics.requests.items() if e == endpoint)
+            samples.append(f"powerscale_request_seconds_bucket{_labels(endpoint=endpoint, le='+Inf')} {total}")
+            samples.append(f"powerscale_request_seconds_sum{_labels(endpoint=endpoint)} {metrics.request_seconds[endpoint]:.6g}")
+            samples.append(f"powerscale_request_seconds_count{_labels(endpoint=endpoint)} {total}")
+        family("powerscale_request_seconds", "histogram", "Request duration.", samples)
+
+    return "\n".join(lines) + "\n"
+
+def _endpoint():
+    return request.endpoint or "unknown"
+
+_EXPLAINABLE = {"SELECT", "WITH", "INSERT", "UPDATE", "DELETE"}
+
+def _query_plan(cursor, statement, parameters):
+    if statement.split(None, 1)[0].upper() not in _EXPLAINABLE:
+        return ""
+    try:
+        rows = cursor.connection.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    except Exception as exc:
+        return f"(no plan: {exc})"
+    return "\n".join(f"  {row[-1]}" for row in rows)
+
+def init_instrumentation(app, engine):
+    metrics = Metrics()
+    app.extensions["metrics"] = metrics
+
+    slow_seconds = app.config["SLOW_QUERY_MS"] / 1000
+    repeat_threshold = app.config["N_PLUS_ONE_THRESHOLD"]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+
+        in_request = has_request_context()
+        if in_request:
+            g.sql_count = g.get("sql_count", 0) + 1
+            g.sql_seconds = g.get("sql_seconds", 0.0) + elapsed
+            g.setdefault("sql_statements", Counter())[statement] += 1
+
+        if elapsed >= slow_seconds:
+            endpoint = _endpoint() if in_request else "none"
+            metrics.record("slow_queries", endpoint)
+
+            plan = "" if executemany else _query_plan(cursor, statement, parameters)
+            logger.warning(
+                "slow query (%.1f ms, %s): %s\n%s",
+                elapsed * 1000, endpoint, statement, plan
+            )
+
+    @app.before_request
+    def _start_request():
+        # requests may share one app context (and g), e.g. under the test
+        # client, so start every request's counts from zero
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.sql_statements = Counter()
+        g.render_seconds = 0.0
+
+    @before_render_template.connect_via(app)
+    def _start_render(sender, template, context, **extra):
+        g.render_started = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def _end_render(sender, template, context, **extra):
+        started = g.pop("render_started", None)
+        if started is not None:
+            g.render_seconds = g.get("render_seconds", 0.0) + time.perf_counter() - started
+
+    def _finish_request(state, endpoint, method, status, started):
+        metrics.record_request(
+            endpoint, method, status,
+            time.perf_counter() - started,
+            state.sql_count, state.sql_seconds, state.render_seconds
+        )
+
+        repeated = [(statement, n) for statement, n in state.sql_statements.items() if n >= repeat_threshold]
+        if repeated:
+            metrics.record("n_plus_one", endpoint)
+            for statement, n in repeated:
+                logger.warning("suspected N+1 in %s: %d x %s", endpoint, n, statement)
+
+    @app.after_request
+    def _end_request(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+
+        finish = (g._get_current_object(), _endpoint(), request.method, response.status_code, started)
+        if response.is_streamed:
+            # a streamed body runs its queries after the headers are sent, so
+            # it gets no X-Query-Count and is recorded when the stream closes
+            response.call_on_close(lambda: _finish_request(*finish))
+            return response
+
+        _finish_request(*finish)
+        response.headers["X-Query-Count"] = str(g.sql_count)
+        return response
@@ -0,0 +1,284 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import select, update
+from app.models import db, Job, Verse
+from app.utils.bulk import CHUNK_SIZE, import_stream
+from app.utils.cache import bump
+from app.utils.changes import compact_changes
+from app.utils.hax import rebuild_cooccurrence
+from app.utils.leaderboard import rebuild_leaderboard
+from app.utils.ranking import resequence_ranks
+from app.utils.search import rebuild_search_index
+from app.utils.transactions import begin_write, write_transaction
+
+# Background jobs for maintenance work too slow for a request. A job is a row
+# in the jobs table; the web app runs it on a small thread pool in the process
+# that queued it, and `flask jobs run` runs one in the foreground. Jobs report
+# progress (which also commits their work so far) and stop with
+# JobCancelled at the next report after a cancel is requested.
+#
+# Work a job committed before it failed or was cancelled is kept.
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    def __init__(self, job_id, on_progress=None):
+        self.job_id = job_id
+        self.on_progress = on_progress
+
+    def progress(self, done, total=None, message=None):
+        # commits the session, so call it between units of work
+        job = db.session.get(Job, self.job_id)
+        job.done = done
+        if total is not None:
+            job.total = total
+        if message is not None:
+            job.message = message
+        db.session.commit()
+
+        if self.on_progress:
+            self.on_progress(job)
+        if job.cancel_requested:
+            raise JobCancelled()
+
+def task(kind, **params):
+    # params: name -> converter for values given as strings (forms, the CLI)
+    def decorator(fn):
+        TASKS[kind] = (fn, params)
+        return fn
+    return decorator
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+def _now():
+    return datetime.now(timezone.utc)
+
+# Tasks
+
+@write_transaction
+def _resequence_verse(verse_id):
+    resequence_ranks(verse_id)
+    db.session.commit()
+
+@task("resequence", verse_id=int)
+def resequence(ctx, verse_id=None):
+    # one verse per transaction, so progress and cancellation are per verse
+    if verse_id is not None:
+        verse_ids = [verse_id]
+    else:
+        verse_ids = db.session.scalars(select(Verse.id).order_by(Verse.id)).all()
+
+    for done, vid in enumerate(verse_ids, start=1):
+        _resequence_verse(vid)
+        ctx.progress(done, len(verse_ids))
+
+    return {"verses": len(verse_ids)}
+
+REBUILDS = {
+    "search": rebuild_search_index,
+    "leaderboard": rebuild_leaderboard,
+    "cooccurrence": rebuild_cooccurrence,
+}
+
+@task("rebuild", target=str)
+def rebuild(ctx, target=None):
+    # derived tables, from scratch
+    if target is not None and target not in REBUILDS:
+        raise ValueError(f"Unknown rebuild target {target!r}; choose from {', '.join(REBUILDS)}.")
+    targets = [target] if target is not None else list(REBUILDS)
+
+    for done, name in enumerate(targets, start=1):
+        REBUILDS[name](db.session.connection())
+        ctx.progress(done, len(targets), f"Rebuilt {name}")
+
+    # written through the connection, so the response cache didn't see it
+    bump("all")
+    return {"rebuilt": targets}
+
+@task("compact_changes")
+def compact_change_log(ctx):
+    begin_write()
+    removed = compact_changes(db.session.connection())
+    ctx.progress(1, 1, f"Removed {removed} superseded changes")
+    return {"removed": removed}
+
+@task("import", path=str, fmt=str, chunk_size=int, cleanup=_flag)
+def import_file(ctx, path, fmt, chunk_size=CHUNK_SIZE, cleanup=False):
+    # progress is bytes read; cleanup removes the file afterwards (uploads)
+    total = os.path.getsize(path)
+
+    try:
+        with open(path, "rb") as raw:
+            def progress(report):
+                ctx.progress(raw.tell(), total, report.summary())
+
+            stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+            report = import_stream(stream, fmt, chunk_size, progress)
+    finally:
+        if cleanup:
+            os.remove(path)
+
+    return {"summary": report.summary(), "errors": report.errors}
+
+@task("delete_verse", verse_id=int)
+def delete_verse(ctx, verse_id):
+    verse = db.session.get(Verse, verse_id)
+    if verse is None:
+        raise ValueError(f"No verse with id {verse_id}.")
+
+    name = verse.name
+    db.session.delete(verse)
+    ctx.progress(1, 1)
+    return {"deleted": name}
+
+# Queueing and running
+
+def create_job(kind, **params):
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job {kind!r}; choose from {', '.join(TASKS)}.")
+    _, spec = TASKS[kind]
+
+    unknown = params.keys() - spec.keys()
+    if unknown:
+        raise ValueError(f"Unknown parameters for {kind}: {', '.join(sorted(unknown))}.")
+
+    job = Job(
+        kind=kind,
+        params={name: spec[name](value) for name, value in params.items() if value is not None},
+        status="queued",
+        pid=os.getpid()
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def enqueue(kind, **params):
+    job = create_job(kind, **params)
+    current_app.extensions["jobs"].submit(job.id)
+    return job
+
+def run_job(job_id, on_progress=None):
+    # claim the job, unless it was cancelled while queued
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "queued")
+        .values(status="running", pid=os.getpid(), started_at=_now())
+    ).rowcount
+    db.session.commit()
+
+    job = db.session.get(Job, job_id)
+    if not claimed:
+        return job
+
+    fn, _ = TASKS[job.kind]
+    message = None
+    try:
+        result = fn(JobContext(job_id, on_progress), **job.params)
+        db.session.commit()
+        status = "succeeded"
+    except JobCancelled:
+        db.session.rollback()
+        result, status = None, "cancelled"
+    except Exception as exc:
+        db.session.rollback()
+        logger.exception("job %s (%s) failed", job_id, job.kind)
+        result, status, message = None, "failed", str(exc)
+
+    job = db.session.get(Job, job_id)
+    job.status = status
+    job.result = result
+    job.finished_at = _now()
+    if message is not None:
+        job.message = message
+    db.session.commit()
+    return job
+
+def cancel_job(job_id):
+    # queued jobs are cancelled outright, running ones at their next progress report
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "queued")
+        .values(status="cancelled", finished_at=_now())
+    )
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running")
+        .values(cancel_requested=True)
+    )
+    db.session.commit()
+
+def _alive(pid):
+    if pid == os.getpid():
+        # this process is only starting, so none of its jobs can be running
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def fail_orphaned_jobs():
+    # jobs whose process went away (restart, crash) will never finish
+    pending = Job.query.filter(Job.status.in_(("queued", "running"))).all()
+    orphaned = [job for job in pending if job.pid is None or not _alive(job.pid)]
+
+    for job in orphaned:
+        job.status = "failed"
+        job.message = "Interrupted: the process running this job exited."
+        job.finished_at = _now()
+    db.session.commit()
+
+class JobRunner:
+    def __init__(self, app, workers):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def submit(self, job_id):
+        self.executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            run_job(job_id)
+
+    def every(self, seconds, kind, **params):
+        # queue the job every `seconds`, skipping a turn while one of its kind
+        # is unfinished (e.g. queued by another worker process)
+        def tick():
+            with self.app.app_context():
+                pending = Job.query.filter(
+                    Job.kind == kind, Job.status.in_(("queued", "running"))
+                ).count()
+                if not pending:
+                    self.submit(create_job(kind, **params).id)
+                db.session.remove()
+            schedule()
+
+        def schedule():
+            timer = threading.Timer(seconds, tick)
+            timer.daemon = True
+            timer.start()
+
+        schedule()
+
+def init_jobs(app):
+    runner = JobRunner(app, app.config["JOB_WORKERS"])
+    app.extensions["jobs"] = runner
+    fail_orphaned_jobs()
+
+    if app.config["CHANGES_COMPACT_INTERVAL"]:
+        runner.every(app.config["CHANGES_COMPACT_INTERVAL"], "compact_changes")
@@ -0,0 +1,104 @@
+from sqlalchemy import delete, func, insert, select, update
+from app.models import db, Character, Key, LeaderboardEntry
+
+# The leaderboard table is a projection of keys ordered by stat ordinals
+# (tier, then AP, speed and durability, strongest first) with the key's
+# displayed rank in its verse (1, 2, 3...) as tie-breaker, so ties compare
+# positions rather than sparse sort keys. Write paths refresh the characters
+# they touched, which renumbers the verses those characters were and are in;
+# deletes cascade from keys, characters and verses.
+
+# Each ordinal (or -1 when unknown) takes one byte of order_key, inverted so
+# that the strongest key has the smallest key.
+_PACKED_STATS = (Key.tier_ord, Key.ap_ord, Key.speed_ord, Key.durability_ord)
+
+# (expression, descending) pairs for keyset pagination
+LEADERBOARD_ORDER = [
+    (LeaderboardEntry.order_key, False),
+    (LeaderboardEntry.verse_rank, False),
+    (LeaderboardEntry.key_id, False),
+]
+
+def _positions(verse_ids=None):
+    # each ranked key's displayed rank within its verse
+    query = (
+        select(
+            Key.id.label("key_id"),
+            func.row_number().over(
+                partition_by=Key.verse_id,
+                order_by=(Key.rank.asc(), Key.id.asc())
+            ).label("position")
+        )
+        .where(Key.rank.isnot(None))
+    )
+    if verse_ids is not None:
+        query = query.where(Key.verse_id.in_(verse_ids))
+    return query.subquery()
+
+def _projection(verse_ids=None):
+    order_key = 0
+    for column in _PACKED_STATS:
+        order_key = order_key * 256 + (254 - func.coalesce(column, -1))
+
+    positions = _positions(verse_ids)
+    verse_rank = func.coalesce(positions.c.position, LeaderboardEntry.NO_RANK)
+
+    position = func.row_number().over(
+        partition_by=Key.character_id,
+        order_by=(order_key, verse_rank, Key.id)
+    )
+
+    return (
+        select(Key.id, Key.character_id, Key.verse_id, order_key, verse_rank, position == 1)
+        .select_from(Key)
+        .outerjoin(positions, positions.c.key_id == Key.id)
+    )
+
+def _renumber(verse_ids=None):
+    # UPDATE ... FROM the verses' positions; unranked keys keep NO_RANK
+    positions = _positions(verse_ids)
+    return (
+        update(LeaderboardEntry)
+        .where(LeaderboardEntry.key_id == positions.c.key_id)
+        .values(verse_rank=positions.c.position)
+    )
+
+_COLUMNS = ["key_id", "character_id", "verse_id", "order_key", "verse_rank", "is_best"]
+
+def refresh_characters(character_ids):
+    character_ids = list(character_ids)
+    if not character_ids:
+        return
+
+    db.session.flush()
+
+    # a rank change moves the other keys of the verse too, and a character
+    # that changed verse leaves a gap in the one it left
+    verse_ids = set(db.session.scalars(
+        select(LeaderboardEntry.verse_id.distinct())
+        .where(LeaderboardEntry.character_id.in_(character_ids))
+    ))
+    verse_ids.update(db.session.scalars(
+        select(Character.verse_id).where(Character.id.in_(character_ids))
+    ))
+
+    db.session.execute(
+        delete(LeaderboardEntry)
+        .where(LeaderboardEntry.character_id.in_(character_ids))
+    )
+    db.session.execute(
+        insert(LeaderboardEntry).from_select(
+            _COLUMNS, _projection(verse_ids).where(Key.character_id.in_(character_ids))
+        )
+    )
+    db.session.execute(_renumber(verse_ids))
+
+def refresh_verse_ranks(*verse_ids):
+    # after keys left the verses other than through refresh_characters,
+    # e.g. a deleted character
+    db.session.flush()
+    db.session.execute(_renumber(verse_ids))
+
+def rebuild_leaderboard(conn):
+    conn.execute(delete(LeaderboardEntry))
+    conn.execute(insert(LeaderboardEntry).from_select(_COLUMNS, _projection()))
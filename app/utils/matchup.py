@@ -0,0 +1,154 @@
+import numpy as np
+from sqlalchemy import func, select
+from app.models import db, Key, Character, Verse, key_hax_table
+
+# N-vs-M matchup engine. Each side's stats are pulled as ordinal arrays
+# (positions on the powerstats scales, -1 when unknown) and compared
+# pairwise with numpy broadcasting; hax overlap uses packed bitsets.
+#
+# advantage[i, j] is from side A's point of view, in -5..5:
+#   2 * sign(tier_a - tier_b)
+#   + sign(ap_a - durability_b)   can A hurt B
+#   + sign(durability_a - ap_b)   can A take B's hits
+#   + sign(speed_a - speed_b)
+# Any comparison involving an unknown stat counts as 0.
+
+UNKNOWN = -1
+
+# Size of the scratch buffers used for hax overlap; small enough to stay in cache
+_BITSET_CHUNK_BYTES = 2 * 1024 * 1024
+
+class MatchupSide:
+    def __init__(self, ids, labels, ap, durability, speed, tier, hax_rows, hax_ids):
+        self.ids = ids
+        self.labels = labels
+        self.ap = ap
+        self.durability = durability
+        self.speed = speed
+        self.tier = tier
+        # parallel arrays: (row index into this side, hax id)
+        self.hax_rows = hax_rows
+        self.hax_ids = hax_ids
+
+    def __len__(self):
+        return len(self.ids)
+
+def load_side(key_ids=None, verse_id=None):
+    query = (
+        select(
+            Key.id,
+            Key.key_name,
+            Character.name,
+            Verse.name,
+            func.coalesce(Key.ap_ord, UNKNOWN),
+            func.coalesce(Key.durability_ord, UNKNOWN),
+            func.coalesce(Key.speed_ord, UNKNOWN),
+            func.coalesce(Key.tier_ord, UNKNOWN),
+        )
+        .join(Character, Key.character_id == Character.id)
+        .join(Verse, Key.verse_id == Verse.id)
+        .order_by(Key.rank.asc().nullslast(), Key.id)
+    )
+
+    if verse_id is not None:
+        query = query.where(Key.verse_id == verse_id)
+    if key_ids is not None:
+        query = query.where(Key.id.in_(key_ids))
+
+    rows = db.session.execute(query).all()
+
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    stats = np.array([r[4:] for r in rows], dtype=np.int16).reshape(len(rows), 4)
+    labels = [f"[{r[3]}] {r[2]} — {r[1]}" for r in rows]
+
+    hax_rows = np.empty(0, dtype=np.int64)
+    hax_ids = np.empty(0, dtype=np.int64)
+    if len(ids):
+        pairs = db.session.execute(
+            select(key_hax_table.c.key_id, key_hax_table.c.hax_id)
+            .where(key_hax_table.c.key_id.in_(query.with_only_columns(Key.id).order_by(None)))
+        ).all()
+        if pairs:
+            pairs = np.array(pairs, dtype=np.int64)
+            order = np.argsort(ids)
+            hax_rows = order[np.searchsorted(ids, pairs[:, 0], sorter=order)]
+            hax_ids = pairs[:, 1]
+
+    return MatchupSide(
+        ids, labels,
+        stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3],
+        hax_rows, hax_ids
+    )
+
+def _versus(x, y):
+    # every scale has fewer than 64 steps, so differences fit in int8
+    result = np.subtract(x.astype(np.int8)[:, None], y.astype(np.int8)[None, :])
+    np.sign(result, out=result)
+    result[x == UNKNOWN, :] = 0
+    result[:, y == UNKNOWN] = 0
+    return result
+
+def _bitsets(side, bit_of, words):
+    bits = np.zeros((len(side), words), dtype=np.uint64)
+    if len(side.hax_ids):
+        positions = bit_of[side.hax_ids]
+        masks = np.left_shift(np.uint64(1), (positions % 64).astype(np.uint64))
+        np.bitwise_or.at(bits, (side.hax_rows, positions // 64), masks)
+    return bits
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _popcount(values, out):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values, out=out)
+    # numpy < 2.0: count set bits one byte at a time
+    as_bytes = values.view(np.uint8).reshape(values.shape + (8,))
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=np.uint8, out=out)
+
+def shared_hax(side_a, side_b):
+    shared = np.zeros((len(side_a), len(side_b)), dtype=np.uint16)
+
+    universe = np.union1d(side_a.hax_ids, side_b.hax_ids)
+    if not len(universe) or not len(side_a) or not len(side_b):
+        return shared
+
+    # map hax ids onto consecutive bit positions
+    bit_of = np.zeros(universe.max() + 1, dtype=np.int64)
+    bit_of[universe] = np.arange(len(universe))
+    words = (len(universe) + 63) // 64
+
+    bits_a = _bitsets(side_a, bit_of, words)
+    bits_b = np.ascontiguousarray(_bitsets(side_b, bit_of, words).T)
+
+    # AND one 64-bit word of A's rows against the same word of every B row,
+    # popcount, accumulate; a block of A rows at a time into reused buffers
+    chunk = max(1, _BITSET_CHUNK_BYTES // (len(side_b) * 8))
+    both = np.empty((chunk, len(side_b)), dtype=np.uint64)
+    counts = np.empty((chunk, len(side_b)), dtype=np.uint8)
+
+    for start in range(0, len(side_a), chunk):
+        stop = min(start + chunk, len(side_a))
+        n = stop - start
+        for word in range(words):
+            np.bitwise_and(bits_a[start:stop, word, None], bits_b[word][None, :], out=both[:n])
+            _popcount(both[:n], counts[:n])
+            shared[start:stop] += counts[:n]
+
+    return shared
+
+def matchup_matrix(side_a, side_b):
+    advantage = _versus(side_a.tier, side_b.tier)
+    advantage *= 2
+    advantage += _versus(side_a.ap, side_b.durability)
+    advantage += _versus(side_a.durability, side_b.ap)
+    advantage += _versus(side_a.speed, side_b.speed)
+
+    return advantage, shared_hax(side_a, side_b)
+
+def summarize(advantage):
+    # per-key record against the other side
+    return {
+        "wins": (advantage > 0).sum(axis=1),
+        "losses": (advantage < 0).sum(axis=1),
+        "even": (advantage == 0).sum(axis=1),
+    }
@@ -0,0 +1,226 @@
+from sqlalchemy import bindparam, case, inspect, select, text, update
+from sqlalchemy.schema import CreateIndex, CreateTable
+from app.models import db, Character, Key, key_hax_table, normalize_name
+from app.powerstats import (
+    AP_ORDINALS, TIER_ORDINALS, DURABILITY_ORDINALS, SPEED_ORDINALS, STAT_SCALES, stat_interval
+)
+from app.utils.ranking import RANK_GAP, resequence_statements
+from app.utils.search import install_search_index, rebuild_search_index
+from app.utils.leaderboard import rebuild_leaderboard
+from app.utils.hax import install_cooccurrence_triggers, rebuild_cooccurrence
+from app.utils.changes import install_change_triggers, seed_change_log
+
+# db.create_all() only creates missing tables, so columns and indexes added to
+# existing tables are applied here. Data migrations are numbered steps tracked
+# with SQLite's PRAGMA user_version; append new steps, never reorder them.
+
+def _backfill_stat_ordinals(conn):
+    conn.execute(
+        update(Key).values(
+            ap_ord=case(AP_ORDINALS, value=Key.ap),
+            tier_ord=case(TIER_ORDINALS, value=Key.tier),
+            durability_ord=case(DURABILITY_ORDINALS, value=Key.durability),
+            speed_ord=case(SPEED_ORDINALS, value=Key.speed),
+        )
+    )
+
+def _spread_ranks(conn):
+    # dense 1..n ranks become sparse sort keys with the same order
+    conn.execute(
+        update(Key)
+        .where(Key.rank.isnot(None))
+        .values(rank=Key.rank * RANK_GAP)
+    )
+
+def _denormalize_key_verse(conn):
+    conn.execute(text(
+        "UPDATE keys SET verse_id = "
+        "(SELECT verse_id FROM characters WHERE characters.id = keys.character_id)"
+    ))
+    # ix_key_verse_rank used to cover rank alone; recreated below as (verse_id, rank)
+    conn.execute(text("DROP INDEX IF EXISTS ix_key_verse_rank"))
+
+def _create_search_index(conn):
+    install_search_index(conn)
+    rebuild_search_index(conn)
+
+def _backfill_normalized_names(conn):
+    # casefold() handles non-ASCII names, which SQLite's lower() does not
+    for model, source, target in (
+        (Character, Character.name, "name_norm"),
+        (Key, Key.key_name, "key_name_norm"),
+    ):
+        rows = conn.execute(db.select(model.id, source)).all()
+        if rows:
+            conn.execute(
+                update(model.__table__)
+                .where(model.__table__.c.id == db.bindparam("row_id"))
+                .values({target: db.bindparam("norm")}),
+                [{"row_id": row_id, "norm": normalize_name(name)} for row_id, name in rows]
+            )
+
+def _rebuild_table(conn, table):
+    # SQLite can't change a table's constraints in place: copy the rows into a
+    # table created from the current model, then swap it in. Rows whose parent
+    # is gone would break the new foreign keys and are left behind.
+    # Indexes and triggers go with the old table and are recreated by upgrade_schema.
+    # copied into the app's metadata so foreign keys resolve, and removed again
+    new = table.to_metadata(db.metadata, name=f"_new_{table.name}")
+    new.indexes.clear()
+    db.metadata.remove(new)
+    conn.execute(CreateTable(new))
+
+    columns = ", ".join(c.name for c in table.columns)
+    parents = " AND ".join(
+        f"({fk.parent.name} IS NULL OR {fk.parent.name} IN "
+        f"(SELECT {fk.column.name} FROM {fk.column.table.name}))"
+        for fk in table.foreign_keys
+    )
+    conn.execute(text(
+        f"INSERT INTO {new.name} ({columns}) SELECT {columns} FROM {table.name}"
+        + (f" WHERE {parents}" if parents else "")
+    ))
+
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {new.name} RENAME TO {table.name}"))
+
+def _cascade_foreign_keys(conn):
+    # parents first, so orphans of orphans are dropped too
+    for table in (Character.__table__, Key.__table__, key_hax_table):
+        _rebuild_table(conn, table)
+
+    rebuild_leaderboard(conn)
+    rebuild_search_index(conn)
+
+def _create_cooccurrence(conn):
+    install_cooccurrence_triggers(conn)
+    rebuild_cooccurrence(conn)
+
+def _backfill_stat_intervals(conn):
+    # the grammar lives in Python, so parse each distinct value once and
+    # write it back to every key that has it
+    keys = Key.__table__
+    for stat in STAT_SCALES:
+        column = keys.c[stat]
+        values = conn.execute(select(column).distinct().where(column.isnot(None))).scalars()
+        intervals = [
+            {"value": value, "low": low, "high": high}
+            for value in values
+            for low, high in [stat_interval(stat, value) or (None, None)]
+        ]
+
+        if intervals:
+            conn.execute(
+                update(keys)
+                .where(column == bindparam("value"))
+                .values({f"{stat}_low": bindparam("low"), f"{stat}_high": bindparam("high")}),
+                intervals
+            )
+
+def _unique_verse_ranks(conn):
+    # concurrent writers could leave two keys of a verse on one rank;
+    # respread every verse so ux_key_verse_rank can be created below
+    conn.execute(text("DROP INDEX IF EXISTS ix_key_verse_rank"))
+    for statement in resequence_statements():
+        conn.execute(statement)
+    rebuild_leaderboard(conn)
+
+def _create_change_log(conn):
+    install_change_triggers(conn)
+    seed_change_log(conn)
+
+def _widen_rank_gaps(conn):
+    # ranks were RANK_GAP = 1024 apart from 0 up; respread them around
+    # RANK_ORIGIN with the wider gap
+    for statement in resequence_statements():
+        conn.execute(statement)
+    rebuild_leaderboard(conn)
+
+def _reparse_stat_intervals(conn):
+    # the grammar now reads "at least" / "at most" as open-ended and
+    # "A | B" and "A-B" as alternatives and ranges
+    _backfill_stat_intervals(conn)
+
+def _tier_ordinals_from_ranges(conn):
+    # tier ranges had no tier_ord; stat_fields now takes their low end
+    conn.execute(
+        update(Key)
+        .where(Key.tier_ord.is_(None), Key.tier_low.isnot(None))
+        .values(tier_ord=Key.tier_low)
+    )
+    rebuild_leaderboard(conn)
+
+def _stat_ordinals_from_ranges(conn):
+    # every stat now takes its interval's low end when it has no exact ordinal
+    for stat in STAT_SCALES:
+        ordinal, low = getattr(Key, f"{stat}_ord"), getattr(Key, f"{stat}_low")
+        conn.execute(update(Key).where(ordinal.is_(None), low.isnot(None)).values({ordinal: low}))
+    rebuild_leaderboard(conn)
+
+def _leaderboard_verse_positions(conn):
+    # verse_rank holds the key's position in its verse, not its sort key
+    rebuild_leaderboard(conn)
+
+MIGRATIONS = [
+    _backfill_stat_ordinals,
+    _spread_ranks,
+    _denormalize_key_verse,
+    _create_search_index,
+    _backfill_normalized_names,
+    rebuild_leaderboard,
+    _cascade_foreign_keys,
+    _create_cooccurrence,
+    _backfill_stat_intervals,
+    _unique_verse_ranks,
+    _create_change_log,
+    _widen_rank_gaps,
+    _reparse_stat_intervals,
+    _tier_ordinals_from_ranges,
+    _stat_ordinals_from_ranges,
+    _leaderboard_verse_positions,
+]
+
+def _add_missing_columns(conn, table):
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+
+    for column in table.columns:
+        if column.name not in existing:
+            col_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+
+def upgrade_schema():
+    with db.engine.connect() as conn:
+        # table rebuilds need foreign keys off, and the pragma is ignored
+        # inside a transaction, so switch it on the DBAPI connection before
+        # BEGIN and restore it after
+        raw = conn.connection.driver_connection
+        foreign_keys = raw.execute("PRAGMA foreign_keys").fetchone()[0]
+        raw.execute("PRAGMA foreign_keys = OFF")
+
+        try:
+            # take the write lock up front, so workers starting together
+            # run the migrations one after another
+            with conn.execution_options(sqlite_begin="IMMEDIATE").begin():
+                _upgrade(conn)
+        finally:
+            raw.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+
+def _upgrade(conn):
+    for table in db.metadata.sorted_tables:
+        _add_missing_columns(conn, table)
+
+    version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        step(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            # IF NOT EXISTS instead of checkfirst, which can't reflect
+            # expression indexes
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+    # triggers are idempotent and must survive table rebuilds
+    install_search_index(conn)
+    install_cooccurrence_triggers(conn)
+    install_change_triggers(conn)
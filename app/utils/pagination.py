@@ -0,0 +1,63 @@
+import base64
+import json
+from sqlalchemy import and_, or_, tuple_
+
+# Keyset (seek) pagination: each page continues strictly after the sort key of
+# the previous page's last row, so deep pages cost the same as the first one.
+# `order` is a list of (expression, descending) pairs ending in a unique column.
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token, order):
+    # a cursor must hold one scalar per sort column; anything else is a
+    # tampered or stale link, reported as ValueError
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise ValueError("invalid cursor") from None
+
+    if not isinstance(values, list) or len(values) != len(order):
+        raise ValueError("invalid cursor")
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError("invalid cursor")
+    return values
+
+def keyset_filter(order, values):
+    if not any(desc for _, desc in order):
+        return tuple_(*(expr for expr, _ in order)) > tuple_(*values)
+
+    clauses = []
+    for i, (expr, desc) in enumerate(order):
+        ties = [order[j][0] == values[j] for j in range(i)]
+        step = expr < values[i] if desc else expr > values[i]
+        clauses.append(and_(*ties, step))
+
+    # the redundant bound on the leading column lets SQLite range-scan its
+    # index instead of expanding the OR
+    lead, desc = order[0]
+    bound = lead <= values[0] if desc else lead >= values[0]
+    return and_(bound, or_(*clauses))
+
+def keyset_page(query, order, after, limit):
+    if after is not None:
+        query = query.filter(keyset_filter(order, after))
+
+    query = query.add_columns(
+        *(expr.label(f"_seek_{i}") for i, (expr, _) in enumerate(order))
+    ).order_by(
+        *(expr.desc() if desc else expr.asc() for expr, desc in order)
+    )
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, [getattr(last, f"_seek_{i}") for i in range(len(order))]
@@ -1,70 +1,242 @@
-from sqlalchemy import func
-from app.models import db, Key, Character
+from datetime import datetime, timezone
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import aliased
+from app.models import db, Key, VerseRanking
 
-def assign_rank(key, verse_id, new_rank):
-    if new_rank is None:
-        key.rank = None
-        return
+# Ranks are stored as sparse sort keys spaced RANK_GAP apart, so a key can be
+# placed between two neighbours without renumbering the rest of the verse.
+# The displayed rank (1, 2, 3...) is the key's position in that order.
+# (verse_id, rank) is unique; writers run in utils/transactions.py's
+# write_transaction and claim the verse's VerseRanking row first.
+#
+# A verse's first key goes at RANK_ORIGIN and keys placed ahead of or after
+# all the others a full gap further out, so there is room for 2**29 of each
+# before a rank would reach 0 or LeaderboardEntry.NO_RANK (2**62). Only keys
+# placed between two neighbours halve a gap, 32 times before a resequence.
+RANK_GAP = 2 ** 32
+RANK_ORIGIN = 2 ** 61
+RANK_MAX = 2 ** 62
+
+def claim_verse_ranks(verse_id):
+    # bump the verse's ranking version; flushing it fails with StaleDataError
+    # if another transaction changed the verse's ranks since we read them
+    ranking = db.session.get(VerseRanking, verse_id)
+    if ranking is None:
+        ranking = VerseRanking(verse_id=verse_id)
+        db.session.add(ranking)
+    ranking.changed_at = datetime.now(timezone.utc)
 
-    new_rank = int(new_rank)
+def tail_rank(verse_id, exclude=None):
+    # the rank a key appended to the verse goes a gap after
+    query = select(func.max(Key.rank)).where(Key.verse_id == verse_id)
+    if exclude is not None:
+        query = query.where(Key.id != exclude)
+    last = db.session.scalar(query)
+    return RANK_ORIGIN - RANK_GAP if last is None else last
 
-    keys_to_shift = (
-        Key.query
-        .join(Character)
+def _rank_between(key, verse_id, position):
+    neighbours = (
+        db.session.query(Key.rank)
         .filter(
-            Character.verse_id == verse_id,
+            Key.verse_id == verse_id,
             Key.rank.isnot(None),
-            Key.rank >= new_rank,
             Key.id != key.id
         )
-        .order_by(Key.rank.desc())  # IMPORTANT
+        .order_by(Key.rank.asc(), Key.id.asc())
+        .offset(max(position - 2, 0))
+        .limit(2 if position > 1 else 1)
         .all()
     )
+    ranks = [r for (r,) in neighbours]
+
+    if position == 1:
+        if not ranks:
+            return RANK_ORIGIN
+        lower, upper = 0, ranks[0]
+        if upper - RANK_GAP > lower:
+            return upper - RANK_GAP
+    elif ranks:
+        lower, upper = ranks[0], (ranks[1] if len(ranks) > 1 else None)
+    else:
+        # past the end of the verse, append after the last ranked key
+        lower, upper = tail_rank(verse_id, exclude=key.id), None
+
+    if upper is None:
+        return lower + RANK_GAP if lower + RANK_GAP < RANK_MAX else None
+    if upper - lower > 1:
+        return (lower + upper) // 2
+    return None  # no gap left between the neighbours
+
+def assign_rank(key, verse_id, new_rank):
+    if new_rank is None:
+        key.rank = None
+        return
+
+    position = max(int(new_rank), 1)
+    claim_verse_ranks(verse_id)
+
+    rank = _rank_between(key, verse_id, position)
+    if rank is None:
+        resequence_ranks(verse_id)
+        rank = _rank_between(key, verse_id, position)
+
+    key.rank = rank
+
+def _expire_ranks():
+    # the UPDATEs below bypass the session, so reload ranks of loaded keys
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Key):
+            db.session.expire(obj, ["rank"])
+
+def resequence_statements(*criteria):
+    # UPDATE ... FROM over a ROW_NUMBER() numbering, per verse. SQLite checks
+    # the unique (verse_id, rank) index row by row, so new ranks are written
+    # negated first (they can't collide with the old ones) and then flipped.
+    numbered = (
+        select(
+            Key.id,
+            func.row_number().over(
+                partition_by=Key.verse_id,
+                order_by=(Key.rank.asc(), Key.id.asc())
+            ).label("position")
+        )
+        .where(Key.rank.isnot(None), *criteria)
+        .subquery()
+    )
 
-    for k in keys_to_shift:
-        k.rank += 1
+    return (
+        update(Key)
+        .where(Key.id == numbered.c.id)
+        .values(rank=-(RANK_ORIGIN + (numbered.c.position - 1) * RANK_GAP)),
+        update(Key)
+        .where(Key.rank < 0, *criteria)
+        .values(rank=-Key.rank),
+    )
 
-    key.rank = new_rank
+def _resequence(*criteria):
+    for statement in resequence_statements(*criteria):
+        db.session.execute(statement, execution_options={"synchronize_session": False})
+    _expire_ranks()
 
 def resequence_ranks(verse_id):
-    keys = (
-        Key.query
-        .join(Character)
+    # compaction: respread the verse's ranks evenly, keeping their order (so
+    # the leaderboard's positions stay as they are)
+    claim_verse_ranks(verse_id)
+    _resequence(Key.verse_id == verse_id)
+
+def resequence_all():
+    # every verse in two statements; callers commit
+    db.session.execute(
+        update(VerseRanking).values(
+            version=VerseRanking.version + 1,
+            changed_at=datetime.now(timezone.utc)
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    _resequence()
+
+def move_character_keys(character_id, verse_id):
+    # a character's keys follow it to another verse; ranked ones go after the
+    # verse's last ranked key, keeping their order, so no rank is taken twice
+    claim_verse_ranks(verse_id)
+    tail = tail_rank(verse_id)
+
+    numbered = (
+        select(
+            Key.id,
+            func.row_number().over(order_by=(Key.rank.asc(), Key.id.asc())).label("position")
+        )
+        .where(Key.character_id == character_id, Key.rank.isnot(None))
+        .subquery()
+    )
+
+    options = {"synchronize_session": False}
+    db.session.execute(
+        update(Key)
+        .where(Key.id == numbered.c.id)
+        .values(verse_id=verse_id, rank=tail + numbered.c.position * RANK_GAP),
+        execution_options=options
+    )
+    db.session.execute(
+        update(Key)
+        .where(Key.character_id == character_id, Key.rank.is_(None))
+        .values(verse_id=verse_id),
+        execution_options=options
+    )
+
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Key) and obj.character_id == character_id:
+            db.session.expire(obj, ["rank", "verse_id"])
+
+def rank_positions(verse_id):
+    position = func.row_number().over(order_by=(Key.rank.asc(), Key.id.asc()))
+
+    rows = (
+        db.session.query(Key.id, position)
         .filter(
-            Character.verse_id == verse_id,
+            Key.verse_id == verse_id,
             Key.rank.isnot(None)
         )
-        .order_by(Key.rank.asc())
-        .all()
     )
 
-    for idx, key in enumerate(keys, start=1):
-        key.rank = idx
+    return dict(rows.all())
+
+def rank_position(key, verse_id):
+    if key.rank is None:
+        return None
+
+    ahead = (
+        db.session.query(func.count(Key.id))
+        .filter(
+            Key.verse_id == verse_id,
+            Key.rank.isnot(None),
+            (Key.rank < key.rank) | ((Key.rank == key.rank) & (Key.id < key.id))
+        )
+        .scalar()
+    )
+
+    return ahead + 1
+
+def rank_position_column():
+    # Key's displayed rank as a column, for queries over many verses; ranks
+    # are unique within a verse, so it is the count of ranks up to the key's
+    ahead = aliased(Key)
+    return case(
+        (Key.rank.is_(None), None),
+        else_=(
+            select(func.count(ahead.id))
+            .where(ahead.verse_id == Key.verse_id, ahead.rank <= Key.rank)
+            .scalar_subquery()
+        )
+    )
 
 def show_one_key(verse_id):
-    subquery = (
-        db.session.query(
-            Key.character_id,
-            func.min(Key.rank).label("best_rank")
+    # each character's best-ranked key; ties on rank go to the older key
+    best = (
+        select(
+            Key.id,
+            func.row_number().over(
+                partition_by=Key.character_id,
+                order_by=(Key.rank.asc(), Key.id.asc())
+            ).label("position")
         )
-        .join(Character)
-        .filter(
-            Character.verse_id == verse_id,
+        .where(
+            Key.verse_id == verse_id,
             Key.rank.isnot(None)
         )
-        .group_by(Key.character_id)
         .subquery()
     )
 
     keys = (
         db.session.query(Key)
-        .join(
-            subquery,
-            (Key.character_id == subquery.c.character_id) &
-            (Key.rank == subquery.c.best_rank)
+        .options(
+            db.joinedload(Key.character),
+            db.selectinload(Key.hax)
         )
-        .order_by(Key.rank.asc())
+        .join(best, Key.id == best.c.id)
+        .filter(best.c.position == 1)
+        .order_by(Key.rank.asc(), Key.id.asc())
         .all()
     )
 
-    return keys
\ No newline at end of file
+    return keys
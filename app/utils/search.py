@@ -0,0 +1,155 @@
+import logging
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import text
+
+# Full-text search over verse, character, key and hax names plus key notes,
+# backed by an SQLite FTS5 table. Each indexed row gets rowid = id * 4 + kind,
+# so triggers can update or delete a document by rowid without a lookup.
+# An SQLite built without FTS5 gets no index, and search falls back to
+# LIKE substring matching over the source tables.
+
+logger = logging.getLogger(__name__)
+
+SEARCH_KINDS = ("verse", "character", "key", "hax")
+
+_SOURCES = {
+    # kind: (table, title column, body column)
+    "verse": ("verses", "name", None),
+    "character": ("characters", "name", None),
+    "key": ("keys", "key_name", "notes"),
+    "hax": ("hax", "name", None),
+}
+
+# private-use characters mark snippet matches until the text is escaped
+_MARK_START, _MARK_END = "\ue000", "\ue001"
+
+def fts5_available(conn):
+    return bool(conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
+
+def search_index_exists(conn):
+    return conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+    )).first() is not None
+
+def install_search_index(conn):
+    if not fts5_available(conn):
+        logger.warning("SQLite was built without FTS5; search falls back to unranked LIKE matching")
+        return
+
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+
+    for kind, (table, title, body) in _SOURCES.items():
+        doc_id = f"{{row}}.id * 4 + {SEARCH_KINDS.index(kind)}"
+        body_sql = f"coalesce({{row}}.{body}, '')" if body else "''"
+        columns = f"{title}, {body}" if body else title
+
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS search_{table}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO search_index(rowid, title, body) VALUES "
+            f"({doc_id.format(row='new')}, new.{title}, {body_sql.format(row='new')}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS search_{table}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+            f"UPDATE search_index SET title = new.{title}, body = {body_sql.format(row='new')} "
+            f"WHERE rowid = {doc_id.format(row='new')}; END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS search_{table}_ad AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM search_index WHERE rowid = {doc_id.format(row='old')}; END"
+        ))
+
+def rebuild_search_index(conn):
+    if not fts5_available(conn):
+        return
+
+    conn.execute(text("DELETE FROM search_index"))
+
+    for kind, (table, title, body) in _SOURCES.items():
+        body_sql = f"coalesce({body}, '')" if body else "''"
+        conn.execute(text(
+            f"INSERT INTO search_index(rowid, title, body) "
+            f"SELECT id * 4 + {SEARCH_KINDS.index(kind)}, {title}, {body_sql} FROM {table}"
+        ))
+
+def match_expression(query):
+    # quote every word and prefix-match it, so user input can't break FTS5 syntax
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+def _highlight(snippet):
+    return Markup(
+        str(escape(snippet))
+        .replace(_MARK_START, "<mark>")
+        .replace(_MARK_END, "</mark>")
+    )
+
+def _like_search(session, query, limit, offset):
+    # every word must appear in the title or body; no ranking or snippets
+    words = re.findall(r"\w+", query)
+    if not words:
+        return []
+
+    documents = []
+    for kind, (table, title, body) in _SOURCES.items():
+        body_sql = f"coalesce({body}, '')" if body else "''"
+        documents.append(
+            f"SELECT id * 4 + {SEARCH_KINDS.index(kind)} AS doc_id, {title} AS title, "
+            f"{body_sql} AS body FROM {table}"
+        )
+    # \w+ words can't hold % or \, but _ is a LIKE wildcard
+    conditions = " AND ".join(
+        f"(title LIKE :word{i} ESCAPE '\\' OR body LIKE :word{i} ESCAPE '\\')"
+        for i in range(len(words))
+    )
+    patterns = {f"word{i}": "%" + word.replace("_", "\\_") + "%" for i, word in enumerate(words)}
+
+    rows = session.execute(
+        text(
+            f"SELECT doc_id, title FROM ({' UNION ALL '.join(documents)}) WHERE {conditions} "
+            "ORDER BY title, doc_id LIMIT :limit OFFSET :offset"
+        ),
+        {**patterns, "limit": limit, "offset": offset},
+    )
+
+    return [
+        {"kind": SEARCH_KINDS[row.doc_id % 4], "id": row.doc_id // 4, "title": row.title, "snippet": None}
+        for row in rows
+    ]
+
+def search(session, query, limit, offset):
+    if not search_index_exists(session):
+        return _like_search(session, query, limit, offset)
+
+    expression = match_expression(query)
+    if not expression:
+        return []
+
+    rows = session.execute(
+        text(
+            "SELECT rowid, title, "
+            "snippet(search_index, 1, :start, :end, '…', 12) AS snippet "
+            "FROM search_index WHERE search_index MATCH :match "
+            "ORDER BY bm25(search_index, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+        ),
+        {
+            "match": expression,
+            "start": _MARK_START,
+            "end": _MARK_END,
+            "limit": limit,
+            "offset": offset,
+        },
+    )
+
+    return [
+        {
+            "kind": SEARCH_KINDS[row.rowid % 4],
+            "id": row.rowid // 4,
+            "title": row.title,
+            "snippet": _highlight(row.snippet) if _MARK_START in row.snippet else None,
+        }
+        for row in rows
+    ]
@@ -0,0 +1,90 @@
+import numpy as np
+from app.powerstats import AP_OPTIONS, SPEED_OPTIONS
+from app.utils.snapshot import EMPTY_SIGNATURE, UNKNOWN
+
+# Nearest keys to a key, over the columnar snapshot (utils/snapshot.py):
+#
+#   score = STAT_WEIGHT * (1 - stat distance) + HAX_WEIGHT * hax similarity
+#
+# Stat distance is the mean over AP, durability and speed of the gap between
+# scale positions as a share of the scale; a stat known on one side only
+# counts as the full gap, unknown on both as none. Hax similarity is the
+# Jaccard index of the hax sets estimated from MinHash signatures (1 when
+# neither key has hax).
+#
+# Only keys in tier buckets near the key's are scored: the window of tiers
+# around it widens until it holds MIN_CANDIDATES keys, or covers every tier.
+
+STAT_WEIGHT = 0.75
+HAX_WEIGHT = 0.25
+
+SIMILAR_STATS = {"ap": len(AP_OPTIONS), "durability": len(AP_OPTIONS), "speed": len(SPEED_OPTIONS)}
+
+MIN_CANDIDATES = 5000
+
+def _candidates(columns, row):
+    order, tiers = columns.tier_order
+    tier = int(columns.stat("tier")[row])
+    if tier == UNKNOWN:
+        return order
+
+    width = 1
+    while True:
+        start = np.searchsorted(tiers, tier - width, "left")
+        stop = np.searchsorted(tiers, tier + width, "right")
+        if stop - start >= MIN_CANDIDATES or (start == 0 and stop == len(tiers)):
+            return order[start:stop]
+        width *= 2
+
+def _stat_distance(columns, row, candidates):
+    distance = np.zeros(len(candidates))
+    for stat, size in SIMILAR_STATS.items():
+        values = columns.stat(stat)
+        mine, theirs = values[row], values[candidates]
+
+        gap = np.abs(theirs.astype(np.int32) - mine) / (size - 1)
+        if mine == UNKNOWN:
+            gap = (theirs != UNKNOWN).astype(float)
+        else:
+            gap[theirs == UNKNOWN] = 1.0
+        distance += gap
+    return distance / len(SIMILAR_STATS)
+
+def _hax_similarity(columns, row, candidates):
+    mine, theirs = columns.signatures[row], columns.signatures[candidates]
+    similarity = (theirs == mine).mean(axis=1)
+
+    # empty sets would "agree" on every slot: only two empty sets are alike
+    mine_empty = mine[0] == EMPTY_SIGNATURE
+    theirs_empty = theirs[:, 0] == EMPTY_SIGNATURE
+    similarity[mine_empty != theirs_empty] = 0.0
+    return similarity
+
+def similar_keys(columns, key_id, limit, exclude_character=True):
+    # [(key id, score, stat distance, hax similarity)] best first, or None
+    # if the key isn't in the snapshot
+    row = np.searchsorted(columns.ids, key_id)
+    if row == len(columns) or columns.ids[row] != key_id:
+        return None
+
+    candidates = _candidates(columns, row)
+    if exclude_character:
+        candidates = candidates[columns.character_ids[candidates] != columns.character_ids[row]]
+    else:
+        candidates = candidates[candidates != row]
+
+    distance = _stat_distance(columns, row, candidates)
+    hax = _hax_similarity(columns, row, candidates)
+    score = STAT_WEIGHT * (1 - distance) + HAX_WEIGHT * hax
+
+    # top k without sorting every candidate, then best first (ties by key id)
+    if len(score) > limit:
+        top = np.argpartition(-score, limit - 1)[:limit]
+    else:
+        top = np.arange(len(score))
+    top = top[np.lexsort((columns.ids[candidates[top]], -score[top]))]
+
+    return [
+        (int(columns.ids[candidates[i]]), float(score[i]), float(distance[i]), float(hax[i]))
+        for i in top
+    ]
@@ -0,0 +1,240 @@
+import copy
+import threading
+from functools import cached_property
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, select
+from app.models import db, Key, key_hax_table
+from app.powerstats import AP_OPTIONS, TIER_OPTIONS, SPEED_OPTIONS
+from app.utils.changes import changes_since, latest_seq
+
+# Columnar copy of the keys table for analytics (stat distributions, verse
+# overviews, percentiles): one numpy array per column, sorted by key id,
+# instead of a Key object per row. Hax membership is sparse, as (key, hax)
+# pairs grouped by hax, and each key's hax set also has a MinHash signature
+# for similarity search (utils/similar.py).
+#
+# The per-process snapshot is refreshed from the change feed
+# (utils/changes.py): a read first compares the last change seq with the
+# snapshot's and reloads only the keys that changed since. It reads through
+# its own connection, so uncommitted writes of the request never get in.
+# With ANALYTICS_SNAPSHOT off every call loads the columns afresh, in the
+# request's transaction.
+
+UNKNOWN = -1
+
+STATS = ("ap", "tier", "durability", "speed")
+STAT_LABELS = {"ap": AP_OPTIONS, "tier": TIER_OPTIONS, "durability": AP_OPTIONS, "speed": SPEED_OPTIONS}
+
+# more changes than this since the last refresh are cheaper to reload in full
+REFRESH_MAX_CHANGES = 5000
+
+# MinHash: the share of equal slots between two signatures estimates the
+# Jaccard similarity of the hax sets, within about 1/sqrt(MINHASH_SLOTS).
+# Slot i hashes a hax id as (a_i * id + b_i) mod a Mersenne prime; a key
+# without hax gets EMPTY_SIGNATURE in every slot.
+MINHASH_SLOTS = 32
+_MINHASH_PRIME = 2 ** 31 - 1
+_MINHASH_A, _MINHASH_B = np.random.default_rng(25).integers(1, _MINHASH_PRIME, size=(2, MINHASH_SLOTS))
+EMPTY_SIGNATURE = np.uint32(_MINHASH_PRIME)
+
+def minhash_signatures(count, rows, hax_ids):
+    # (count, MINHASH_SLOTS) signatures from (row, hax id) pairs
+    signatures = np.full((count, MINHASH_SLOTS), EMPTY_SIGNATURE, dtype=np.uint32)
+    if len(rows):
+        order = np.argsort(rows, kind="stable")
+        rows, hax_ids = rows[order], hax_ids[order]
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+
+        # a slot at a time keeps the scratch array at one int64 per pair
+        for slot in range(MINHASH_SLOTS):
+            hashes = (hax_ids * _MINHASH_A[slot] + _MINHASH_B[slot]) % _MINHASH_PRIME
+            signatures[rows[starts], slot] = np.minimum.reduceat(hashes, starts)
+    return signatures
+
+class KeyColumns:
+    def __init__(self, seq, ids, verse_ids, character_ids, stats, signatures, hax_key_ids, hax_ids):
+        self.seq = seq
+        self.ids = ids
+        self.verse_ids = verse_ids
+        self.character_ids = character_ids
+        # (n, 4) scale positions in STATS order, UNKNOWN when not on the scale
+        self.stats = stats
+        self.signatures = signatures
+
+        order = np.lexsort((hax_key_ids, hax_ids))
+        self.hax_key_ids = hax_key_ids[order]
+        self.hax_ids = hax_ids[order]
+        self.hax_rows = np.searchsorted(ids, self.hax_key_ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def stat(self, name):
+        return self.stats[:, STATS.index(name)]
+
+    @cached_property
+    def tier_order(self):
+        # rows sorted by tier and the sorted tiers: every tier bucket, or
+        # run of neighbouring buckets, is one slice of tier_order
+        order = np.argsort(self.stat("tier"), kind="stable")
+        return order, self.stat("tier")[order]
+
+    def rows_with_hax(self, hax_id):
+        start, stop = np.searchsorted(self.hax_ids, [hax_id, hax_id + 1])
+        return self.hax_rows[start:stop]
+
+    def mask(self, verse_id=None, hax_id=None):
+        selected = np.ones(len(self), dtype=bool)
+        if verse_id is not None:
+            selected &= self.verse_ids == verse_id
+        if hax_id is not None:
+            with_hax = np.zeros(len(self), dtype=bool)
+            with_hax[self.rows_with_hax(hax_id)] = True
+            selected &= with_hax
+        return selected
+
+def _read(conn, key_ids=None):
+    # (ids, verse ids, character ids, stats, signatures, hax key ids, hax ids)
+    # of the given keys, or of every key
+    query = select(
+        Key.id, Key.verse_id, Key.character_id,
+        *(func.coalesce(getattr(Key, f"{stat}_ord"), UNKNOWN) for stat in STATS)
+    ).order_by(Key.id)
+    links = select(key_hax_table.c.key_id, key_hax_table.c.hax_id)
+
+    if key_ids is not None:
+        query = query.where(Key.id.in_(key_ids))
+        links = links.where(key_hax_table.c.key_id.in_(key_ids))
+
+    # numpy reads plain tuples far faster than Row objects
+    rows = np.array([tuple(r) for r in conn.execute(query)], dtype=np.int64).reshape(-1, 3 + len(STATS))
+    pairs = np.array([tuple(r) for r in conn.execute(links)], dtype=np.int64).reshape(-1, 2)
+
+    ids = rows[:, 0]
+    return (
+        ids,
+        rows[:, 1].astype(np.int32),
+        rows[:, 2].astype(np.int32),
+        rows[:, 3:].astype(np.int16),
+        minhash_signatures(len(ids), np.searchsorted(ids, pairs[:, 0]), pairs[:, 1]),
+        pairs[:, 0],
+        pairs[:, 1],
+    )
+
+def load_columns(conn):
+    seq = latest_seq(conn)
+    return KeyColumns(seq, *_read(conn))
+
+def _apply(conn, columns, key_ops, seq):
+    # drop every changed key, then add back the ones that still exist
+    changed = np.fromiter(key_ops, dtype=np.int64, count=len(key_ops))
+    upserted = [key_id for key_id, op in key_ops.items() if op == "upsert"]
+    ids, verse_ids, character_ids, stats, signatures, hax_key_ids, hax_ids = _read(conn, upserted)
+
+    keep = ~np.isin(columns.ids, changed)
+    ids = np.concatenate((columns.ids[keep], ids))
+    order = np.argsort(ids, kind="stable")
+
+    keep_links = ~np.isin(columns.hax_key_ids, changed)
+    return KeyColumns(
+        seq,
+        ids[order],
+        np.concatenate((columns.verse_ids[keep], verse_ids))[order],
+        np.concatenate((columns.character_ids[keep], character_ids))[order],
+        np.concatenate((columns.stats[keep], stats))[order],
+        np.concatenate((columns.signatures[keep], signatures))[order],
+        np.concatenate((columns.hax_key_ids[keep_links], hax_key_ids)),
+        np.concatenate((columns.hax_ids[keep_links], hax_ids)),
+    )
+
+class KeySnapshot:
+    def __init__(self, engine):
+        self.engine = engine
+        self.columns = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        with self.engine.connect() as conn:
+            columns = self.columns
+            if columns is not None and latest_seq(conn) <= columns.seq:
+                return columns
+
+            with self.lock:
+                self.columns = self._refresh(conn, self.columns)
+                return self.columns
+
+    def _refresh(self, conn, columns):
+        if columns is None:
+            return load_columns(conn)
+
+        ops, seq, more = changes_since(conn, columns.seq, REFRESH_MAX_CHANGES)
+        if more:
+            return load_columns(conn)
+        if not ops["key"]:
+            # only verse, character or hax rows changed; the keys they
+            # take along log changes of their own
+            refreshed = copy.copy(columns)
+            refreshed.seq = seq
+            return refreshed
+        return _apply(conn, columns, ops["key"], seq)
+
+def init_snapshot(app):
+    if app.config["ANALYTICS_SNAPSHOT"]:
+        app.extensions["key_snapshot"] = KeySnapshot(db.engine)
+
+def key_columns():
+    snapshot = current_app.extensions.get("key_snapshot")
+    if snapshot is not None:
+        return snapshot.current()
+
+    return load_columns(db.session.connection())
+
+# Analytics
+
+def stat_distribution(columns, stat, selected=None):
+    # [(scale label, keys at that position)] from weakest up, then unknowns
+    values = columns.stat(stat)
+    if selected is not None:
+        values = values[selected]
+
+    labels = STAT_LABELS[stat]
+    known = values[values != UNKNOWN]
+    counts = np.bincount(known, minlength=len(labels))
+    return [*zip(labels, counts.tolist()), ("Unknown", int(len(values) - len(known)))]
+
+def verse_overview(columns):
+    # {verse_id: (keys, characters, strongest tier position or None)}
+    if not len(columns):
+        return {}
+
+    verses, inverse, keys = np.unique(columns.verse_ids, return_inverse=True, return_counts=True)
+
+    pairs = np.unique(np.stack((columns.verse_ids, columns.character_ids), axis=1), axis=0)
+    characters = np.bincount(np.searchsorted(verses, pairs[:, 0]), minlength=len(verses))
+
+    top = np.full(len(verses), UNKNOWN, dtype=np.int16)
+    np.maximum.at(top, inverse, columns.stat("tier"))
+
+    return {
+        int(verse): (int(n), int(c), None if t == UNKNOWN else int(t))
+        for verse, n, c, t in zip(verses, keys, characters, top)
+    }
+
+def stat_percentiles(columns, key_id):
+    # {stat: percent of keys with a known value strictly below this key's},
+    # None where the key's value is unknown; None if the key isn't there
+    row = np.searchsorted(columns.ids, key_id)
+    if row == len(columns) or columns.ids[row] != key_id:
+        return None
+
+    result = {}
+    for stat in STATS:
+        values = columns.stat(stat)
+        mine = values[row]
+        known = values[values != UNKNOWN]
+        if mine == UNKNOWN or not len(known):
+            result[stat] = None
+        else:
+            result[stat] = round(100 * np.count_nonzero(known < mine) / len(known))
+    return result
@@ -0,0 +1,38 @@
+from sqlalchemy import event
+
+# Connection-level SQLite settings. PRAGMAs such as busy_timeout, foreign_keys
+# and cache_size only last for one connection, so they are applied to every
+# connection the pool opens.
+
+def install_pragmas(engine, pragmas):
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+# pysqlite starts transactions itself, lazily and only before writes, so a
+# transaction can't ask for BEGIN IMMEDIATE. Switch that off and emit BEGIN
+# from SQLAlchemy instead; a connection with the execution option
+# sqlite_begin="IMMEDIATE" takes the write lock when its transaction starts
+# (see utils/transactions.py). PRAGMAs that must run outside a transaction go
+# through the DBAPI connection.
+
+def install_transaction_control(engine):
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _disable_implicit_begin(dbapi_connection, _):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        mode = conn.get_execution_options().get("sqlite_begin", "DEFERRED")
+        conn.exec_driver_sql(f"BEGIN {mode}")
@@ -0,0 +1,65 @@
+import logging
+import random
+import time
+from functools import wraps
+from flask import has_request_context, request
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+from app.models import db
+
+# Write transactions that race with other workers. SQLite has one writer at
+# a time; BEGIN IMMEDIATE takes the write lock before the first read, so a
+# read-modify-write such as placing a key between its rank neighbours can't
+# interleave with another worker's. What still fails -- the lock not freeing
+# within busy_timeout, a verse_rankings version conflict, or two writers
+# picking the same (verse_id, rank) -- is rolled back and retried with
+# jittered exponential backoff.
+
+logger = logging.getLogger(__name__)
+
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05  # seconds, doubled per attempt
+
+_RETRY_INTEGRITY = ("keys.verse_id, keys.rank", "verse_rankings.verse_id")
+
+def begin_write():
+    # the session's next transaction starts with BEGIN IMMEDIATE
+    if not db.session().in_transaction():
+        db.session.connection(execution_options={"sqlite_begin": "IMMEDIATE"})
+
+def _retryable(exc):
+    if isinstance(exc, StaleDataError):
+        return True
+    if isinstance(exc, OperationalError):
+        message = str(exc.orig)
+        return "locked" in message or "busy" in message
+    if isinstance(exc, IntegrityError):
+        return any(name in str(exc.orig) for name in _RETRY_INTEGRITY)
+    return False
+
+def write_transaction(fn):
+    # views: only POSTs write, GETs run as they are
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if has_request_context() and request.method == "GET":
+            return fn(*args, **kwargs)
+
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            db.session.rollback()
+            try:
+                # BEGIN IMMEDIATE itself fails when the lock doesn't free in time
+                begin_write()
+                return fn(*args, **kwargs)
+            except (IntegrityError, OperationalError, StaleDataError) as exc:
+                db.session.rollback()
+                if attempt == RETRY_ATTEMPTS or not _retryable(exc):
+                    raise
+
+                delay = RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.warning(
+                    "write conflict in %s (attempt %d), retrying in %.0f ms: %s",
+                    fn.__name__, attempt, delay * 1000, getattr(exc, "orig", exc)
+                )
+                time.sleep(delay)
+
+    return wrapper
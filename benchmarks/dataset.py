@@ -0,0 +1,81 @@
+import random
+from app.powerstats import AP_OPTIONS, SPEED_OPTIONS
+
+# Seeded synthetic catalog in the bulk import format (see app/utils/bulk.py).
+# Every verse has a power level on the AP scale; its characters sit around it
+# and each character's keys get stronger, with durability and speed following
+# AP loosely. Characters have a hax kit drawn from a skewed pool, so a few hax
+# are very common and most are rare, as in real data.
+
+HAX_POOL = [
+    "Regeneration", "Flight", "Energy Projection", "Enhanced Senses", "Telekinesis",
+    "Immortality", "Shapeshifting", "Teleportation", "Invisibility", "Intangibility",
+    "Fire Manipulation", "Ice Manipulation", "Electricity Manipulation", "Forcefield Creation",
+    "Telepathy", "Mind Manipulation", "Precognition", "Summoning", "Size Manipulation",
+    "Duplication", "Sealing", "Power Nullification", "Time Stop", "Time Manipulation",
+    "Space-Time Manipulation", "Reality Warping", "Soul Manipulation", "Durability Negation",
+    "Resistance Negation", "Causality Manipulation", "Conceptual Manipulation",
+    "Probability Manipulation", "Information Manipulation", "Existence Erasure",
+    "Acausality", "Non-Corporeal", "Abstract Existence", "Plot Manipulation",
+]
+
+SIZES = {
+    # name: (verses, characters per verse, keys per character)
+    "small": (5, 20, 3),
+    "medium": (20, 100, 3),
+    "large": (50, 200, 4),
+}
+
+RANKED_SHARE = 0.8
+
+def _clamp(index, options):
+    return options[max(0, min(len(options) - 1, index))]
+
+def _hax_kit(rng, weights):
+    size = min(len(HAX_POOL), max(0, int(rng.expovariate(1 / 3))))
+    kit = set()
+    while len(kit) < size:
+        kit.add(rng.choices(HAX_POOL, weights)[0])
+    return sorted(kit)
+
+def generate_records(seed, verses, characters, keys):
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(len(HAX_POOL))]
+
+    for v in range(verses):
+        verse = f"Verse {v + 1:04d}"
+        level = rng.randrange(len(AP_OPTIONS) - 10)
+        rows = []
+
+        for c in range(characters):
+            character = f"{verse} Character {c + 1:04d}"
+            ap = max(0, level + round(rng.gauss(0, 3)))
+            kit = _hax_kit(rng, weights)
+
+            for k in range(keys):
+                ap += rng.randrange(3)
+                speed = round(ap * len(SPEED_OPTIONS) / len(AP_OPTIONS)) + rng.randrange(-2, 3)
+                hax = [h for h in kit if rng.random() < 0.8]
+                if rng.random() < 0.2:
+                    hax.append(rng.choices(HAX_POOL, weights)[0])
+
+                rows.append({
+                    "verse": verse,
+                    "character": character,
+                    "key_name": f"Key {k + 1}",
+                    "ap": _clamp(ap, AP_OPTIONS),
+                    "durability": _clamp(ap + rng.randrange(-1, 2), AP_OPTIONS),
+                    "speed": _clamp(speed, SPEED_OPTIONS),
+                    "notes": f"Synthetic key {k + 1} of {character}",
+                    "hax": sorted(set(hax)),
+                    "strength": ap,
+                })
+
+        # strongest keys rank highest; some keys stay unranked
+        ordered = sorted(rows, key=lambda r: -r["strength"])
+        for position, row in enumerate(ordered, start=1):
+            row["rank"] = position if rng.random() < RANKED_SHARE else None
+
+        for row in rows:
+            del row["strength"]
+            yield row
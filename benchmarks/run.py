@@ -0,0 +1,237 @@
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from app import create_app
+from app.models import db, Verse, Character, Key
+from app.utils.bulk import import_records
+from app.utils.ranking import assign_rank, resequence_ranks, show_one_key
+from benchmarks.dataset import SIZES, generate_records
+
+# Benchmark harness: builds a seeded dataset in an in-memory database for each
+# size, then times every read route through the Flask test client and the
+# ranking functions directly. Writes are rolled back after each run so every
+# repetition sees the same data.
+#
+#   python -m benchmarks.run --sizes small,medium --output before.json
+#   python -m benchmarks.run compare before.json after.json
+
+def _timed(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+def _pick(query):
+    return db.session.scalar(query.limit(1))
+
+def _targets():
+    # a mid-sized verse, one of its characters and two keys from different verses
+    verse_id = _pick(
+        db.select(Key.verse_id)
+        .group_by(Key.verse_id)
+        .order_by(db.func.count(Key.id).desc(), Key.verse_id)
+        .offset(db.session.scalar(db.select(db.func.count(Verse.id))) // 2)
+    )
+    other_verse = _pick(db.select(Verse.id).where(Verse.id != verse_id).order_by(Verse.id))
+    char_id = _pick(db.select(Character.id).where(Character.verse_id == verse_id).order_by(Character.id))
+    key_a = _pick(db.select(Key.id).where(Key.verse_id == verse_id).order_by(Key.id))
+    key_b = _pick(db.select(Key.id).where(Key.verse_id == other_verse).order_by(Key.id))
+
+    return {
+        "verse_id": verse_id,
+        "other_verse": other_verse,
+        "char_id": char_id,
+        "key_a": key_a,
+        "key_b": key_b,
+    }
+
+def _routes(t):
+    return {
+        "GET /": "/",
+        "GET /verses": "/verses",
+        "GET /hax": "/hax",
+        "GET /hax/<id>": "/hax/1",
+        "GET /keys": "/keys",
+        "GET /keys?sort=tier": "/keys?sort=tier",
+        "GET /keys?min_tier=5-B": "/keys?min_tier=5-B",
+        "GET /verse/<id>": f"/verse/{t['verse_id']}",
+        "GET /verse/<id>?single=1": f"/verse/{t['verse_id']}?single=1",
+        "GET /character/<id>": f"/character/{t['char_id']}",
+        "GET /compare": f"/compare?key_a={t['key_a']}&key_b={t['key_b']}",
+        "GET /keys/typeahead": "/keys/typeahead?q=verse 0001 char",
+        "GET /search": "/search?q=synthetic key",
+        "GET /leaderboard": "/leaderboard",
+        "GET /leaderboard?all=1": "/leaderboard?all=1",
+        "GET /stats": "/stats",
+        "GET /stats?verse_id=": f"/stats?verse_id={t['verse_id']}",
+        "GET /key/<id>/similar": f"/key/{t['key_a']}/similar?format=json",
+        "GET /matchup": f"/matchup?a_verse={t['verse_id']}&b_verse={t['other_verse']}&format=json",
+        "GET /export.csv": "/export.csv",
+        "GET /api/v1/verses/<id>/rankings": f"/api/v1/verses/{t['verse_id']}/rankings",
+        "GET /api/v1/keys?ids=": f"/api/v1/keys?ids={t['key_a']},{t['key_b']}",
+    }
+
+def _rolled_back(fn):
+    def run():
+        try:
+            fn()
+            db.session.flush()
+        finally:
+            db.session.rollback()
+    return run
+
+def _ranking_ops(t):
+    verse_id = t["verse_id"]
+    ranked = db.session.scalar(
+        db.select(db.func.count(Key.id)).where(Key.verse_id == verse_id, Key.rank.isnot(None))
+    )
+
+    def place(position):
+        def op():
+            key = db.session.get(Key, t["key_a"])
+            assign_rank(key, verse_id, position)
+        return op
+
+    def delete_verse():
+        db.session.delete(db.session.get(Verse, verse_id))
+
+    return {
+        "assign_rank head": place(1),
+        "assign_rank middle": place(max(ranked // 2, 1)),
+        "assign_rank tail": place(ranked + 1),
+        "resequence_ranks": lambda: resequence_ranks(verse_id),
+        "show_one_key": lambda: show_one_key(verse_id),
+        "delete verse": delete_verse,
+    }
+
+def run_size(name, seed, repeat):
+    verses, characters, keys = SIZES[name]
+    app = create_app("testing")
+    results = []
+
+    with app.app_context():
+        records = generate_records(seed, verses, characters, keys)
+        report = import_records(enumerate(records, start=1))
+        t = _targets()
+
+        meta = {
+            "size": name,
+            "verses": verses,
+            "characters": verses * characters,
+            "keys": report.keys,
+            "import_rows_per_second": round(report.rows_per_second),
+        }
+
+        client = app.test_client()
+        for label, url in _routes(t).items():
+            def request(url=url):
+                response = client.get(url)
+                response.get_data()
+                assert response.status_code == 200, (url, response.status_code)
+            results.append({"size": name, "name": label, **_timed(request, repeat)})
+
+        for label, op in _ranking_ops(t).items():
+            results.append({"size": name, "name": label, **_timed(_rolled_back(op), repeat)})
+
+        db.session.remove()
+        db.engine.dispose()
+
+    return meta, results
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    output = {
+        "revision": _git_revision(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "datasets": [],
+        "results": [],
+    }
+
+    for name in args.sizes.split(","):
+        print(f"benchmarking {name}...", file=sys.stderr)
+        meta, results = run_size(name, args.seed, args.repeat)
+        output["datasets"].append(meta)
+        output["results"].extend(results)
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    old = {(r["size"], r["name"]): r for r in before["results"]}
+
+    print(f"{before.get('revision')} -> {after.get('revision')}")
+    print(f"{'size':<8} {'benchmark':<28} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for r in after["results"]:
+        prev = old.get((r["size"], r["name"]))
+        if prev is None:
+            continue
+        change = r["median_ms"] / prev["median_ms"] - 1 if prev["median_ms"] else 0.0
+        flag = "  <<" if change > args.threshold else "  >>" if change < -args.threshold else ""
+        print(
+            f"{r['size']:<8} {r['name']:<28} {prev['median_ms']:>10.2f} "
+            f"{r['median_ms']:>10.2f} {change:>+8.1%}{flag}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="PowerScaleDB benchmarks")
+    sub = parser.add_subparsers(dest="command")
+
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+
+    diff = sub.add_parser("compare", help="compare two result files by median time")
+    diff.add_argument("before")
+    diff.add_argument("after")
+    diff.add_argument("--threshold", type=float, default=0.10, help="flag changes beyond this fraction")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare(args)
+    else:
+        run(args)
+
+if __name__ == "__main__":
+    main()
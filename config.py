@@ -1 +1,98 @@
-# placeholder for any fun changes that may happen in the future
+import os
+
+# Configuration profiles, picked by create_app(config_name) or the
+# POWERSCALE_ENV environment variable (development by default).
+# The database lives in instance/powerscale.db unless POWERSCALE_DATABASE_URI is set.
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.environ.get("POWERSCALE_DATABASE_URI")
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    # PRAGMAs run on every new SQLite connection
+    SQLITE_PRAGMAS = {
+        "busy_timeout": 5000,
+        "foreign_keys": "ON",
+    }
+
+    # Response cache: memory:// is a per-process LRU for single-process
+    # deployments, redis://... is shared between workers (needs the redis
+    # package); empty disables it. Entries expire after RESPONSE_CACHE_TTL
+    # seconds in either backend.
+    RESPONSE_CACHE_URL = os.environ.get("POWERSCALE_CACHE_URL", "memory://")
+    RESPONSE_CACHE_MAX_ENTRIES = 2048
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    RESPONSE_CACHE_TTL = 24 * 3600
+
+    # JSON API responses may be reused this long without revalidating; with
+    # 0 clients revalidate every time, which their ETag makes cheap
+    API_MAX_AGE = 0
+
+    # Instrumentation: statements at least this slow are logged with their
+    # query plan; one statement repeated this often in a request is a likely N+1
+    SLOW_QUERY_MS = 100
+    N_PLUS_ONE_THRESHOLD = 5
+
+    # Threads running background jobs per process. SQLite takes one writer at
+    # a time, so more workers mostly wait on each other.
+    JOB_WORKERS = 1
+
+    # Keep a columnar in-memory copy of the keys for analytics (/stats, verse
+    # overviews, compare percentiles), refreshed from the change feed;
+    # off, those pages read the columns from the database on every request
+    ANALYTICS_SNAPSHOT = True
+
+    # Seconds between compactions of the change feed's log (/api/v1/changes);
+    # 0 turns periodic compaction off
+    CHANGES_COMPACT_INTERVAL = 3600
+
+
+class DevelopmentConfig(Config):
+    # SQLite defaults apart from busy_timeout and foreign keys; fine for a single process
+    pass
+
+
+class ProductionConfig(Config):
+    # WAL lets readers run alongside a writer, so several workers can share
+    # the database; NORMAL sync is safe with WAL and avoids an fsync per commit.
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 10000,
+        "foreign_keys": "ON",
+        "cache_size": -64000,        # KiB, i.e. 64 MB per connection
+        "mmap_size": 268435456,      # 256 MB
+        "temp_store": "MEMORY",
+    }
+
+    # a per-process cache would miss other workers' writes, so production
+    # only caches when given a shared backend
+    RESPONSE_CACHE_URL = os.environ.get("POWERSCALE_CACHE_URL")
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        # SQLite connections don't go stale, but recycle them now and then anyway
+        "pool_recycle": 3600,
+    }
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    RESPONSE_CACHE_URL = None
+    SQLITE_PRAGMAS = {
+        "foreign_keys": "ON",
+    }
+    CHANGES_COMPACT_INTERVAL = 0
+    # the in-memory database is one shared connection, which the snapshot's
+    # own connection would reset under the session
+    ANALYTICS_SNAPSHOT = False
+
+
+CONFIGS = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+    "testing": TestingConfig,
+}
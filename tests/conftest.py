@@ -0,0 +1,19 @@
+import os
+
+# lazy loads raise in tests (app/models.py reads this at import time)
+os.environ["POWERSCALE_STRICT_LOADING"] = "1"
+
+import pytest
+from app import create_app
+from app.models import db
+
+@pytest.fixture
+def app():
+    app = create_app("testing")
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,38 @@
+import io
+from app.models import db, Key
+from app.utils.bulk import export_records, import_records, import_stream
+
+CSV = """verse,character,key_name,ap,rank
+Verse,Character,First,Planet,2
+Verse,Character,Infinite,Planet,inf
+Verse,Character,Negative infinite,Planet,-inf
+Verse,Character,Not a number,Planet,nan
+Verse,Character,Word,Planet,first
+Verse,Character,Second,Planet,1.5
+"""
+
+def test_unparseable_ranks_skip_the_row(app):
+    report = import_stream(io.StringIO(CSV), "csv")
+
+    assert report.keys == 2
+    assert report.skipped == 4
+    assert [error.split(":")[0] for error in report.errors] == ["line 3", "line 4", "line 5", "line 6"]
+    assert db.session.scalars(db.select(Key.key_name).order_by(Key.rank)).all() == ["Second", "First"]
+
+def test_export_writes_displayed_ranks_that_reimport_in_order(app):
+    rows = "".join(f"Verse,Character,Key {i},Planet,{rank}\n" for i, rank in enumerate([3, 1, 2, ""]))
+    import_stream(io.StringIO("verse,character,key_name,ap,rank\n" + rows), "csv")
+
+    exported = list(export_records())
+    assert [(r["key_name"], r["rank"]) for r in exported if r.get("key_name")] == [
+        ("Key 0", 3), ("Key 1", 1), ("Key 2", 2), ("Key 3", None),
+    ]
+
+    for key in db.session.scalars(db.select(Key)):
+        db.session.delete(key)
+    db.session.commit()
+
+    import_records(enumerate(exported, start=2))
+    assert db.session.scalars(
+        db.select(Key.key_name).where(Key.rank.isnot(None)).order_by(Key.rank)
+    ).all() == ["Key 1", "Key 2", "Key 0"]
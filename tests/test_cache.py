@@ -0,0 +1,73 @@
+import pytest
+from app import create_app
+from app.models import db, Verse, Character, Key, Hax
+from app.utils import cache
+from app.utils.cache import MemoryCache
+from config import TestingConfig
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(TestingConfig, "RESPONSE_CACHE_URL", "memory://")
+    app = create_app("testing")
+    with app.app_context():
+        first, second = Verse(name="First Verse"), Verse(name="Second Verse")
+        db.session.add_all([first, second])
+        db.session.flush()
+        character = Character(name="Old Name", verse_id=first.id)
+        hax = Hax(name="Old Hax")
+        db.session.add_all([character, hax])
+        db.session.flush()
+        db.session.add(Key(key_name="Key", ap="Planet", character=character, verse_id=first.id, rank=1, hax=[hax]))
+        db.session.commit()
+
+    # no app context of our own, so each request gets a fresh session
+    return app.test_client()
+
+def _cached(client, url):
+    # fetch twice, so the page is known to be served from the cache
+    client.get(url)
+    response = client.get(url)
+    assert response.headers["X-Cache"] == "HIT"
+    return response
+
+def test_renaming_a_character_invalidates_its_pages(client):
+    for url in ("/character/1", "/keys", "/verse/1"):
+        assert b"Old Name" in _cached(client, url).data
+
+    client.post("/character/1/edit", data={"name": "New Name", "verse_id": "1"})
+
+    for url in ("/character/1", "/keys", "/verse/1"):
+        response = client.get(url)
+        assert response.headers["X-Cache"] == "MISS"
+        assert b"New Name" in response.data and b"Old Name" not in response.data
+
+def test_moving_a_character_invalidates_both_verses(client):
+    assert b"Old Name" in _cached(client, "/verse/1").data
+    assert b"Old Name" not in _cached(client, "/verse/2").data
+
+    client.post("/character/1/edit", data={"name": "Old Name", "verse_id": "2"})
+
+    assert b"Old Name" not in client.get("/verse/1").data
+    assert b"Old Name" in client.get("/verse/2").data
+
+def test_renaming_a_hax_invalidates_pages_that_show_it(client):
+    for url in ("/hax", "/verse/1", "/character/1"):
+        assert b"Old Hax" in _cached(client, url).data
+
+    client.post("/hax/1/edit", data={"name": "New Hax"})
+
+    for url in ("/hax", "/verse/1", "/character/1"):
+        response = client.get(url)
+        assert b"New Hax" in response.data and b"Old Hax" not in response.data
+
+def test_memory_cache_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+
+    backend = MemoryCache(max_entries=10, max_bytes=1024, ttl=60)
+    backend.set("page", b"body", "text/html")
+    assert backend.get("page") == (b"body", "text/html")
+
+    now[0] += 61
+    assert backend.get("page") is None
+    assert backend.size == 0
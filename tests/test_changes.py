@@ -0,0 +1,89 @@
+from app.models import db, Change, Verse, Character, Key, Hax
+from app.utils.changes import changes_since, compact_changes, latest_seq
+
+def _log(since=0):
+    return db.session.execute(
+        db.select(Change.entity, Change.entity_id, Change.op).where(Change.seq > since).order_by(Change.seq)
+    ).all()
+
+def _catalog():
+    verse = Verse(name="Verse")
+    db.session.add(verse)
+    db.session.commit()
+    character = Character(name="Character", verse_id=verse.id)
+    hax = Hax(name="Hax")
+    db.session.add_all([character, hax])
+    db.session.commit()
+    key = Key(key_name="Key", ap="Planet", character=character, verse_id=verse.id, hax=[hax])
+    db.session.add(key)
+    db.session.commit()
+    return verse, character, hax, key
+
+def test_triggers_log_inserts_updates_and_deletes(app):
+    verse, character, hax, key = _catalog()
+    assert _log() == [
+        ("verse", verse.id, "upsert"),
+        ("character", character.id, "upsert"),
+        ("hax", hax.id, "upsert"),
+        ("key", key.id, "upsert"),
+        # the key_hax link logs its key
+        ("key", key.id, "upsert"),
+    ]
+
+    seq = latest_seq(db.session)
+    key.notes = "edited"
+    db.session.commit()
+    assert _log(seq) == [("key", key.id, "upsert")]
+
+    # ON DELETE CASCADE removes the key and its links inside SQLite
+    seq = latest_seq(db.session)
+    key_id = key.id
+    db.session.delete(character)
+    db.session.commit()
+    assert sorted(_log(seq)) == [("character", character.id, "delete"), ("key", key_id, "delete")]
+
+    ops, next_seq, more = changes_since(db.session, 0, 100)
+    assert ops == {
+        "verse": {verse.id: "upsert"},
+        "character": {character.id: "delete"},
+        "key": {key_id: "delete"},
+        "hax": {hax.id: "upsert"},
+    }
+    assert (next_seq, more) == (latest_seq(db.session), False)
+
+def test_compaction_keeps_each_entitys_latest_change(app):
+    verse, character, hax, key = _catalog()
+    key.notes = "edited"
+    hax.name = "Renamed"
+    db.session.commit()
+
+    before = changes_since(db.session, 0, 100)[0]
+    logged = len(_log())
+    last = latest_seq(db.session)
+    middle = last // 2
+
+    removed = compact_changes(db.session.connection())
+    db.session.commit()
+
+    assert removed == logged - len(_log()) > 0
+    assert sorted(_log()) == sorted({(entity, i, op) for entity, ids in before.items() for i, op in ids.items()})
+    assert changes_since(db.session, 0, 100)[0] == before
+    assert latest_seq(db.session) == last
+
+    # a client that stopped partway still gets everything changed after it
+    ops, next_seq, _ = changes_since(db.session, middle, 100)
+    assert ops["key"] == {key.id: "upsert"} and ops["hax"] == {hax.id: "upsert"}
+    assert next_seq == last
+
+def test_changes_endpoint_serves_upserts_and_deletes(app, client):
+    verse, character, hax, key = _catalog()
+    key_id = key.id
+    db.session.delete(key)
+    db.session.commit()
+
+    body = client.get("/api/v1/changes?since=0").get_json()
+    assert [v["name"] for v in body["verses"]["upserts"]] == ["Verse"]
+    assert body["keys"] == {"upserts": [], "deletes": [key_id]}
+    assert body["next"] == latest_seq(db.session) and body["more"] is False
+
+    assert client.get(f"/api/v1/changes?since={body['next']}").get_json()["verses"]["upserts"] == []
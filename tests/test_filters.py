@@ -0,0 +1,17 @@
+from app.models import db, Verse, Character, Key
+from app.utils.filters import apply_stat_filters
+
+def test_min_and_max_filters_keep_ranges_by_their_low_end(app):
+    verse = Verse(name="Verse")
+    character = Character(name="Character", verse_obj=verse)
+    db.session.add_all([verse, character])
+    db.session.flush()
+    for name, ap in (("Open", "At least Planet"), ("Exact", "Planet"), ("Weak", "Town"), ("Blank", "Unknown")):
+        db.session.add(Key(key_name=name, ap=ap, tier=ap, character=character, verse_id=verse.id))
+    db.session.commit()
+
+    def names(**args):
+        return sorted(k.key_name for k in apply_stat_filters(Key.query, args))
+
+    assert names(min_ap="Planet") == ["Exact", "Open"]
+    assert names(max_ap="Planet") == ["Exact", "Open", "Weak"]
@@ -0,0 +1,23 @@
+import logging
+
+def test_query_counts_start_fresh_for_each_request(client, caplog):
+    client.get("/hax")
+    first = client.get("/hax")
+    with caplog.at_level(logging.WARNING, logger="app.utils.instrumentation"):
+        for _ in range(5):
+            response = client.get("/hax")
+            assert response.headers["X-Query-Count"] == first.headers["X-Query-Count"]
+
+    assert "suspected N+1" not in caplog.text
+
+def test_streamed_responses_are_recorded_when_the_stream_closes(app, client):
+    metrics = app.extensions["metrics"]
+
+    response = client.get("/export.csv")
+    assert "X-Query-Count" not in response.headers
+    assert metrics.queries["main.bulk_export"] == 0
+
+    response.get_data()
+    response.close()
+    assert metrics.requests[("main.bulk_export", "GET", 200)] == 1
+    assert metrics.queries["main.bulk_export"] > 0
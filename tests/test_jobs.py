@@ -0,0 +1,32 @@
+import io
+import os
+from app.models import db, Job
+
+def test_jobs_form_only_starts_maintenance_jobs(client, tmp_path):
+    victim = tmp_path / "victim.txt"
+    victim.write_text("keep me")
+
+    response = client.post("/jobs", data={"kind": "import", "path": str(victim), "fmt": "csv", "cleanup": "1"})
+    assert response.status_code == 200
+    assert b"Unknown job" in response.data
+    assert victim.exists()
+    assert db.session.scalar(db.select(db.func.count(Job.id))) == 0
+
+def test_jobs_form_drops_fields_the_job_does_not_take(client):
+    response = client.post("/jobs", data={"kind": "rebuild", "target": "search", "path": "/etc/passwd"})
+    assert response.status_code == 302
+
+    job = db.session.scalars(db.select(Job)).one()
+    assert (job.kind, job.params) == ("rebuild", {"target": "search"})
+
+def test_import_rejects_unknown_formats(app, client):
+    uploads = os.path.join(app.instance_path, "uploads")
+    before = set(os.listdir(uploads)) if os.path.isdir(uploads) else set()
+
+    response = client.post("/import", data={
+        "file": (io.BytesIO(b"verse\nVerse\n"), "catalog.csv"),
+        "format": "../../evil",
+    })
+    assert b"Unknown format" in response.data
+    assert db.session.scalar(db.select(db.func.count(Job.id))) == 0
+    assert (set(os.listdir(uploads)) if os.path.isdir(uploads) else set()) == before
@@ -0,0 +1,86 @@
+from app.models import db, Verse, Character, Key, LeaderboardEntry
+from app.utils.leaderboard import LEADERBOARD_ORDER, refresh_characters, refresh_verse_ranks
+from app.utils.ranking import assign_rank, move_character_keys, rank_positions
+
+def _character(verse, name):
+    character = Character(name=name, verse_id=verse.id)
+    db.session.add(character)
+    db.session.flush()
+    return character
+
+def _key(character, name, position):
+    key = Key(key_name=name, ap="Planet", tier="5-B", character=character, verse_id=character.verse_id)
+    db.session.add(key)
+    db.session.flush()
+    assign_rank(key, character.verse_id, position)
+    refresh_characters([character.id])
+    return key
+
+def _verse_ranks():
+    return dict(db.session.execute(db.select(LeaderboardEntry.key_id, LeaderboardEntry.verse_rank)).all())
+
+def _expected_ranks():
+    expected = {key_id: LeaderboardEntry.NO_RANK for key_id in db.session.scalars(db.select(Key.id))}
+    for verse_id in db.session.scalars(db.select(Verse.id)):
+        expected.update(rank_positions(verse_id))
+    return expected
+
+def test_ties_across_verses_break_on_position_not_sort_key(app):
+    a, b = Verse(name="A"), Verse(name="B")
+    db.session.add_all([a, b])
+    db.session.flush()
+
+    # b's first key sits a gap above where a's fifth key does
+    b_character = _character(b, "B1")
+    gone = _key(b_character, "gone", 1)
+    first_b = _key(b_character, "b", 2)
+    db.session.delete(gone)
+    refresh_characters([b_character.id])
+
+    fifth_a = _key(_character(a, "A1"), "a", 1)
+    for _ in range(4):
+        _key(_character(a, "head"), "head", 1)
+    db.session.commit()
+
+    assert first_b.rank > fifth_a.rank
+    ranks = _verse_ranks()
+    assert ranks[first_b.id] == 1
+    assert ranks[fifth_a.id] == 5
+
+    order = db.session.scalars(
+        db.select(LeaderboardEntry.key_id).order_by(*(column for column, _ in LEADERBOARD_ORDER))
+    ).all()
+    assert order.index(first_b.id) < order.index(fifth_a.id)
+
+def test_positions_follow_deletes_and_moves(app):
+    a, b = Verse(name="A"), Verse(name="B")
+    db.session.add_all([a, b])
+    db.session.flush()
+
+    characters = [_character(a, f"A{i}") for i in range(3)]
+    for i, character in enumerate(characters):
+        _key(character, f"k{i}", i + 1)
+    _key(_character(b, "B0"), "b0", 1)
+    db.session.commit()
+    assert _verse_ranks() == _expected_ranks()
+
+    # a key removed from the head of A
+    key = db.session.scalars(db.select(Key).where(Key.key_name == "k0")).one()
+    db.session.delete(key)
+    refresh_characters([key.character_id])
+    db.session.commit()
+    assert _verse_ranks() == _expected_ranks()
+
+    # a character moved from A to B
+    moved = characters[1]
+    moved.verse_id = b.id
+    move_character_keys(moved.id, b.id)
+    refresh_characters([moved.id])
+    db.session.commit()
+    assert _verse_ranks() == _expected_ranks()
+
+    # a whole character deleted
+    db.session.delete(characters[2])
+    refresh_verse_ranks(a.id)
+    db.session.commit()
+    assert _verse_ranks() == _expected_ranks()
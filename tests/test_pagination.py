@@ -0,0 +1,46 @@
+import base64
+import json
+import re
+from html import unescape as html_unescape
+import pytest
+from app.models import db, Verse, Character, Key
+from app.utils.pagination import decode_cursor, encode_cursor
+
+ORDER = [(Key.id, False), (Key.key_name, False)]
+
+def _token(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def test_decode_cursor_round_trips_and_rejects_bad_shapes():
+    assert decode_cursor(None, ORDER) is None
+    assert decode_cursor(encode_cursor([3, "Key"]), ORDER) == [3, "Key"]
+
+    for token in ("%%%", _token({"id": 3}), _token([3]), _token([3, "Key", 1]), _token([3, ["Key"]]), _token([True, "Key"])):
+        with pytest.raises(ValueError):
+            decode_cursor(token, ORDER)
+
+@pytest.fixture
+def keys(client):
+    verse = Verse(name="Verse")
+    character = Character(name="Character", verse_obj=verse)
+    db.session.add_all([verse, character])
+    db.session.flush()
+    for i, ap in enumerate(("Planet", "Planet", "Star", None, "Town")):
+        db.session.add(Key(key_name=f"Key {i}", ap=ap, character=character, verse_id=verse.id))
+    db.session.commit()
+    return client
+
+def test_keys_listing_answers_bad_cursors_with_400(keys):
+    assert keys.get("/keys?sort=ap&after=" + _token([5, "Verse"])).status_code == 400
+    assert keys.get("/keys?after=" + _token(["Verse", "Character", {}])).status_code == 400
+    assert keys.get("/leaderboard?after=" + _token([1])).status_code == 400
+
+def test_sorted_keys_page_through_ties_in_order(keys):
+    seen, url = [], "/keys?sort=ap&limit=2"
+    while url:
+        page = keys.get(url)
+        assert page.status_code == 200
+        html = page.get_data(as_text=True)
+        seen += re.findall(r"<td>(Key \d)</td>", html)
+        url = html_unescape(next(iter(re.findall(r'href="(/keys\?[^"]*after=[^"]*)"', html)), "")) or None
+    assert seen == ["Key 2", "Key 0", "Key 1", "Key 4", "Key 3"]
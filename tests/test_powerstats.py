@@ -0,0 +1,56 @@
+import pytest
+from app.powerstats import AP_OPTIONS, TIER_OPTIONS, stat_fields, stat_interval, tier_from_ap
+
+TOP = len(AP_OPTIONS) - 1
+
+def ap(value):
+    return AP_OPTIONS.index(value)
+
+@pytest.mark.parametrize("value, expected", [
+    ("Planet", (ap("Planet"), ap("Planet"))),
+    ("Planet level", (ap("Planet"), ap("Planet"))),
+    ("High Star", (ap("Star"), ap("Star"))),
+    ("Star to Galaxy", (ap("Star"), ap("Galaxy"))),
+    ("Multi-City Block+ (likely Town)", (ap("Multi-City Block"), ap("Town"))),
+    ("Multi-City Block", (ap("Multi-City Block"), ap("Multi-City Block"))),
+    ("At least Planet", (ap("Planet"), TOP)),
+    ("Likely at least Star", (ap("Star"), TOP)),
+    ("At most Town", (0, ap("Town"))),
+    ("Up to City", (0, ap("City"))),
+    ("Likely up to City", (0, ap("City"))),
+    ("Small Town up to City", (ap("Small Town"), ap("City"))),
+    ("Planet | Star", (ap("Planet"), ap("Star"))),
+    ("Mountain-Island", (ap("Mountain"), ap("Island"))),
+    ("Multi-City Block-Town", (ap("Multi-City Block"), ap("Town"))),
+    ("Unknown", None),
+    ("", None),
+])
+def test_ap_intervals(value, expected):
+    assert stat_interval("ap", value) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ("Low 2-C to 2-B", ("Low 2-C", "2-B")),
+    ("Low 2-C-2-B", ("Low 2-C", "2-B")),
+    ("At least 5-B", ("5-B", "0")),
+])
+def test_tier_intervals(value, expected):
+    low, high = expected
+    assert stat_interval("tier", value) == (TIER_OPTIONS.index(low), TIER_OPTIONS.index(high))
+
+def test_tier_from_ap_keeps_open_ends():
+    assert tier_from_ap("Planet") == TIER_OPTIONS[ap("Planet")]
+    assert tier_from_ap("At least Planet") == f"At least {TIER_OPTIONS[ap('Planet')]}"
+    assert tier_from_ap("Up to City") == f"At most {TIER_OPTIONS[ap('City')]}"
+    assert stat_interval("tier", tier_from_ap("At least Planet")) == (ap("Planet"), len(TIER_OPTIONS) - 1)
+
+def test_ranges_take_their_low_end_as_ordinal():
+    low = TIER_OPTIONS.index("Low 2-C")
+    assert stat_fields("tier", "Low 2-C to 2-B")["tier_ord"] == low
+    assert stat_fields("tier", tier_from_ap("At least Planet"))["tier_ord"] == ap("Planet")
+    assert stat_fields("ap", "At least Planet")["ap_ord"] == ap("Planet")
+    assert stat_fields("durability", "Mountain-Island")["durability_ord"] == ap("Mountain")
+    assert stat_fields("speed", "Up to FTL")["speed_ord"] == 0
+
+@pytest.mark.parametrize("stat", ["ap", "tier", "durability", "speed"])
+def test_unparseable_values_have_no_ordinal(stat):
+    assert stat_fields(stat, "Unknown")[f"{stat}_ord"] is None
@@ -0,0 +1,72 @@
+from app.models import db, Verse, Character, Key
+from app.utils import ranking
+from app.utils.ranking import RANK_GAP, assign_rank, rank_positions
+
+def _verse_with_keys(count):
+    verse = Verse(name="Verse")
+    character = Character(name="Character", verse_obj=verse)
+    db.session.add_all([verse, character])
+    db.session.flush()
+
+    keys = []
+    for i in range(count):
+        key = Key(key_name=f"Key {i}", ap="Planet level", character=character, verse_id=verse.id)
+        db.session.add(key)
+        db.session.flush()
+        assign_rank(key, verse.id, i + 1)
+        db.session.flush()
+        keys.append(key)
+    return verse, character, keys
+
+def _ordered(verse_id):
+    positions = rank_positions(verse_id)
+    return sorted(positions, key=positions.get)
+
+def test_repeated_head_inserts_do_not_resequence(app, monkeypatch):
+    verse, character, keys = _verse_with_keys(3)
+
+    def fail(verse_id):
+        raise AssertionError("resequence_ranks called")
+    monkeypatch.setattr(ranking, "resequence_ranks", fail)
+
+    for i in range(200):
+        key = Key(key_name=f"Head {i}", ap="Planet level", character=character, verse_id=verse.id)
+        db.session.add(key)
+        db.session.flush()
+        assign_rank(key, verse.id, 1)
+        db.session.flush()
+        keys.insert(0, key)
+
+    assert _ordered(verse.id) == [k.id for k in keys]
+
+def test_head_and_tail_inserts_take_a_full_gap(app):
+    verse, character, keys = _verse_with_keys(3)
+    first, last = keys[0].rank, keys[-1].rank
+
+    head = Key(key_name="Head", ap="Planet level", character=character, verse_id=verse.id)
+    tail = Key(key_name="Tail", ap="Planet level", character=character, verse_id=verse.id)
+    db.session.add_all([head, tail])
+    db.session.flush()
+    assign_rank(head, verse.id, 1)
+    assign_rank(tail, verse.id, 5)
+
+    assert head.rank == first - RANK_GAP
+    assert tail.rank == last + RANK_GAP
+
+def test_middle_inserts_resequence_once_the_gap_is_used_up(app, monkeypatch):
+    verse, character, keys = _verse_with_keys(2)
+
+    calls = []
+    resequence = ranking.resequence_ranks
+    monkeypatch.setattr(ranking, "resequence_ranks", lambda verse_id: (calls.append(verse_id), resequence(verse_id)))
+
+    for i in range(40):
+        key = Key(key_name=f"Middle {i}", ap="Planet level", character=character, verse_id=verse.id)
+        db.session.add(key)
+        db.session.flush()
+        assign_rank(key, verse.id, 2)
+        db.session.flush()
+        keys.insert(1, key)
+
+    assert calls
+    assert _ordered(verse.id) == [k.id for k in keys]
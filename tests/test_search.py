@@ -0,0 +1,42 @@
+from sqlalchemy import text
+from app.models import db, Verse, Character, Key
+from app.utils.search import search
+
+def _drop_search_index():
+    # what an SQLite built without FTS5 ends up with
+    triggers = db.session.scalars(text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'search\\_%' ESCAPE '\\'"
+    )).all()
+    for name in triggers:
+        db.session.execute(text(f"DROP TRIGGER {name}"))
+    db.session.execute(text("DROP TABLE search_index"))
+
+def _catalog():
+    verse = Verse(name="Dragon Ball")
+    goku = Character(name="Goku", verse_obj=verse)
+    db.session.add_all([verse, goku])
+    db.session.flush()
+    db.session.add_all([
+        Key(key_name="Base", ap="Planet", character=goku, verse_id=verse.id, notes="Start of Super"),
+        Key(key_name="Ultra_Instinct", ap="Universe", character=goku, verse_id=verse.id),
+    ])
+    db.session.commit()
+
+def test_search_uses_the_index(app):
+    _catalog()
+    results = search(db.session, "goku", 10, 0)
+    assert [(r["kind"], r["title"]) for r in results] == [("character", "Goku")]
+
+def test_search_falls_back_to_like_without_the_index(app, client):
+    _drop_search_index()
+    _catalog()
+
+    results = search(db.session, "super start", 10, 0)
+    assert [(r["kind"], r["title"], r["snippet"]) for r in results] == [("key", "Base", None)]
+
+    assert [r["title"] for r in search(db.session, "ultra_instinct", 10, 0)] == ["Ultra_Instinct"]
+    assert search(db.session, "ultra_x", 10, 0) == []
+
+    response = client.get("/search?q=dragon")
+    assert response.status_code == 200
+    assert b"Dragon Ball" in response.data
@@ -0,0 +1,90 @@
+import logging
+import sqlite3
+import threading
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app import create_app
+from app.models import db, Verse, Character, Key
+from app.utils.ranking import RANK_ORIGIN, assign_rank
+from app.utils.transactions import write_transaction
+from config import TestingConfig
+
+@pytest.fixture
+def file_app(tmp_path, monkeypatch):
+    # writers on separate connections need a database file
+    path = tmp_path / "powerscale.db"
+    monkeypatch.setattr(TestingConfig, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{path}")
+    monkeypatch.setattr(TestingConfig, "SQLITE_PRAGMAS", {"foreign_keys": "ON", "busy_timeout": 500})
+
+    app = create_app("testing")
+    with app.app_context():
+        verse = Verse(name="Verse")
+        db.session.add(verse)
+        db.session.flush()
+        db.session.add(Character(name="Character", verse_id=verse.id))
+        db.session.commit()
+        yield app, path
+        db.session.remove()
+        db.engine.dispose()
+
+def test_write_retries_while_another_writer_holds_the_lock(file_app, caplog):
+    _, path = file_app
+    blocker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(1.0, blocker.commit)
+    release.start()
+
+    attempts = []
+
+    @write_transaction
+    def add_key():
+        attempts.append(len(attempts) + 1)
+        key = Key(key_name="Key", ap="Planet", character_id=1, verse_id=1)
+        db.session.add(key)
+        db.session.flush()
+        assign_rank(key, 1, 1)
+        db.session.commit()
+
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.utils.transactions"):
+            add_key()
+    finally:
+        release.join()
+        blocker.close()
+
+    assert "write conflict in add_key" in caplog.text
+    assert db.session.scalar(db.select(Key.rank)) == RANK_ORIGIN
+
+def test_concurrent_writers_never_share_a_rank(file_app):
+    app, _ = file_app
+    writers, per_writer = 4, 10
+    failures = []
+
+    def write(n):
+        client = app.test_client()
+        for i in range(per_writer):
+            response = client.post("/character/1/add_key", data={
+                "key_name": f"Key {n}.{i}", "ap": "Planet", "rank": str(1 + i % 2)
+            })
+            if response.status_code != 302:
+                failures.append(response.status_code)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    counts = db.session.execute(
+        db.select(db.func.count(Key.id), db.func.count(Key.rank.distinct()))
+    ).one()
+    assert tuple(counts) == (writers * per_writer, writers * per_writer)
+
+def test_the_unique_index_rejects_a_taken_rank(file_app):
+    db.session.add_all([
+        Key(key_name="First", ap="Planet", character_id=1, verse_id=1, rank=RANK_ORIGIN),
+        Key(key_name="Second", ap="Planet", character_id=1, verse_id=1, rank=RANK_ORIGIN),
+    ])
+    with pytest.raises(IntegrityError, match="keys.verse_id, keys.rank"):
+        db.session.commit()